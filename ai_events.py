@@ -0,0 +1,662 @@
+import importlib.util
+import json
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# キャッシュ済みの提案に選ばれたプレイヤー名を差し込むための目印
+NAME_PLACEHOLDER = "\x00name\x00"
+
+AICacheInfo = namedtuple("AICacheInfo", ["hits", "misses", "size", "max_entries"])
+
+def build_ai_event_prompt(selected_player, all_players):
+    """AIイベント生成用のプロンプトを作成"""
+    # 他のプレイヤーの状況を要約
+    other_status = []
+    for p in all_players:
+        if p['name'] != selected_player['name']:
+            other_status.append(f"{p['name']}: 酔い度{p['drunk_degree']:.1f}%")
+
+    other_info = ", ".join(other_status) if other_status else "他にプレイヤーなし"
+
+    return f"""
+        飲みゲームのAIマスターとして、ゲームを盛り上げる追加イベントを提案してください。
+
+        選ばれたプレイヤー: {selected_player['name']}
+        酔い度: {selected_player['drunk_degree']:.1f}%
+        総飲酒量: {selected_player['total_drunk']:.1f}杯
+
+        他のプレイヤー: {other_info}
+
+        以下のいずれかの形式で簡潔に提案してください：
+        - 「追加で0.5杯飲む」（さらに飲む）
+        - 「今回は免除」（飲まなくてよい）
+        - 「全員で乾杯」（みんなで少し飲む）
+        - 「特別なことなし」（通常通り）
+
+        理由も一言で添えてください。
+        """
+
+def build_batch_prompt(players, cases):
+    """全員分の提案を1回で頼むプロンプト（cases は (選ばれた後の本人, 選ばれた後の全員) の並び）"""
+    current = ", ".join(f"{p['name']}: 酔い度{p['drunk_degree']:.1f}%" for p in players)
+    candidates = "\n".join(
+        f"        - {selected['name']}: 酔い度{selected['drunk_degree']:.1f}%、総飲酒量{selected['total_drunk']:.1f}杯"
+        for selected, _ in cases
+    )
+    return f"""
+        飲みゲームのAIマスターとして、次に選ばれた人に出す追加イベントを、候補者全員について事前に考えてください。
+
+        現在の全員の状況: {current}
+
+        候補者（それぞれ選ばれて飲んだ後の状態）:
+{candidates}
+
+        各候補者について、以下のいずれかの形式で簡潔に提案してください：
+        - 「追加で0.5杯飲む」（さらに飲む）
+        - 「今回は免除」（飲まなくてよい）
+        - 「全員で乾杯」（みんなで少し飲む）
+        - 「特別なことなし」（通常通り）
+
+        理由も一言で添えてください。
+        回答は候補者名をキー、提案文を値とする JSON オブジェクトだけを出力してください。
+        """
+
+def parse_batch_response(text, names):
+    """JSON（コードブロック囲みも可）から候補者ごとの提案を取り出す"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        raise ValueError("JSON が見つかりません")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("JSON オブジェクトではありません")
+    return {name: str(data[name]).strip() for name in names if str(data.get(name, "")).strip()}
+
+def ai_event_cache_key(selected_player, all_players, drunk_step=10.0, total_step=1.0):
+    """プロンプトを左右する数値を丸めたキャッシュキー
+
+    選ばれた人の酔い度・総飲酒量と、他の人の酔い度（並び順は無視）を段階に丸める。
+    """
+    def bucket(value, step):
+        return int(float(value) // step)
+
+    others = sorted(bucket(p['drunk_degree'], drunk_step)
+                    for p in all_players if p['name'] != selected_player['name'])
+    return (bucket(selected_player['drunk_degree'], drunk_step),
+            bucket(selected_player['total_drunk'], total_step),
+            tuple(others))
+
+def cache_template(text, selected_player, all_players):
+    """提案文をキャッシュ用のひな形にする（本人の名前を目印に置き換える）
+
+    キャッシュはプロセス全体で共有され、キーに名前は入らないので、
+    本人以外の名前を含む提案は別のゲームに漏れないよう None（キャッシュしない）にする。
+    名前は長いものから順に、英数字の途中では一致させない（「プレイヤー1」と「プレイヤー10」を区別する）。
+    """
+    name = selected_player['name']
+    names = sorted({p['name'] for p in all_players} | {name}, key=len, reverse=True)
+    if not name or not all(names):
+        return None
+    pattern = re.compile(r"(?<![0-9A-Za-z])(?:" + "|".join(map(re.escape, names)) + r")(?![0-9A-Za-z])")
+    if any(match.group(0) != name for match in pattern.finditer(text)):
+        return None
+    return pattern.sub(lambda match: NAME_PLACEHOLDER, text)
+
+class AIEventCache:
+    """丸めたゲーム状況ごとにAIの提案を数件ずつ保持する TTL＋LRU キャッシュ
+
+    1つのキーに variants 件たまるまではミス扱いで生成し、たまった後は
+    その中からランダムに返す（同じ状況でも毎回同じ提案にならないように）。
+    """
+    def __init__(self, ttl_seconds=1800.0, max_entries=512, variants=3, rng=None, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.variants = variants
+        self._rng = rng or random.Random()
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (作成時刻, [提案...])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """提案が十分たまっていれば1件返す（無ければ None）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] >= self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None or len(entry[1]) < self.variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._rng.choice(entry[1])
+
+    def put(self, key, text):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() - entry[0] >= self.ttl_seconds:
+                entry = (self._clock(), [])
+                self._entries[key] = entry
+            if len(entry[1]) < self.variants:
+                entry[1].append(text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        """ヒット・ミス数とエントリ数"""
+        with self._lock:
+            return AICacheInfo(self.hits, self.misses, len(self._entries), self.max_entries)
+
+def snapshot_player(player):
+    """バックグラウンドで使うため、その時点の状態を dict に写す"""
+    return {'name': str(player['name']),
+            'drunk_degree': float(player['drunk_degree']),
+            'total_drunk': float(player['total_drunk'])}
+
+class AIEventStream:
+    """生成途中の提案文と、最初のトークン・完了までの時間（秒）
+
+    バックグラウンドのスレッドが feed() し、画面側は text を定期的に読む。
+    """
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._chunks = []
+        self.started_at = clock()
+        self.first_token_seconds = None
+        self.total_seconds = None
+        self.source = None
+
+    @property
+    def text(self):
+        with self._lock:
+            return "".join(self._chunks)
+
+    @property
+    def done(self):
+        return self.total_seconds is not None
+
+    def feed(self, chunk):
+        with self._lock:
+            if self.first_token_seconds is None:
+                self.first_token_seconds = self._clock() - self.started_at
+            self._chunks.append(chunk)
+
+    def reset(self):
+        """途中まで届いた文を捨てる（フォールバックで生成し直すとき）"""
+        with self._lock:
+            self._chunks = []
+
+    def finish(self, source):
+        self.source = source
+        self.total_seconds = self._clock() - self.started_at
+
+class AIEventBackend(ABC):
+    """AIイベント生成の共通インターフェース
+
+    generate() は提案文を返し、失敗時は例外を送出する。
+    stream() は提案文を少しずつ返す（既定では generate() の結果を一度に返す）。
+    """
+    name = "base"
+
+    @abstractmethod
+    def generate(self, selected_player, all_players):
+        ...
+
+    def stream(self, selected_player, all_players):
+        yield self.generate(selected_player, all_players)
+
+    def generate_batch(self, players, cases):
+        """候補者ごとの提案を {名前: 提案文} で返す（既定では1人ずつ generate()）"""
+        return {selected['name']: self.generate(selected, all_players) for selected, all_players in cases}
+
+def gemini_installed():
+    """google-generativeai が入っているか（SDK 本体は読み込まずに調べる）"""
+    try:
+        return importlib.util.find_spec("google.generativeai") is not None
+    except ModuleNotFoundError:
+        return False
+
+class GeminiLoader:
+    """google.generativeai を初回利用時に読み込んで設定する
+
+    SDK の import（grpc・protobuf）は起動時間の大半を占めるため、起動時には読まず、
+    最初の生成か warm_up() によるバックグラウンドの先読みまで遅らせる。
+    """
+    def __init__(self, api_key, model_name='gemini-pro'):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.import_seconds = None
+        self._module = None
+        self._lock = threading.Lock()
+        self._warming = False
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self.import_seconds = time.perf_counter() - started
+                self._module = genai
+            return self._module
+
+    def warm_up(self):
+        """バックグラウンドのスレッドで一度だけ読み込んでおく（失敗は初回利用時に改めて扱う）"""
+        with self._lock:
+            if self._warming or self._module is not None:
+                return
+            self._warming = True
+        threading.Thread(target=self._warm, name="genai-warm-up", daemon=True).start()
+
+    def _warm(self):
+        try:
+            self.load()
+        except Exception:
+            pass
+
+    def model(self):
+        return self.load().GenerativeModel(self.model_name)
+
+class GeminiBackend(AIEventBackend):
+    """Gemini API による生成"""
+    name = "gemini"
+
+    def __init__(self, model_factory):
+        self._model_factory = model_factory
+
+    def generate(self, selected_player, all_players):
+        prompt = build_ai_event_prompt(selected_player, all_players)
+        return self._model_factory().generate_content(prompt).text.strip()
+
+    def stream(self, selected_player, all_players):
+        prompt = build_ai_event_prompt(selected_player, all_players)
+        for chunk in self._model_factory().generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    def generate_batch(self, players, cases):
+        prompt = build_batch_prompt(players, cases)
+        text = self._model_factory().generate_content(prompt).text
+        return parse_batch_response(text, [selected['name'] for selected, _ in cases])
+
+class RuleBasedBackend(AIEventBackend):
+    """プロンプトと同じ状況（酔い度・総飲酒量）からルールで即座に決めるローカル生成"""
+    name = "local"
+
+    REASONS = {
+        'exempt': ["もう十分酔っているので休憩！", "顔が赤いのでここはお水で。", "ペース配分も大事です。"],
+        'extra': ["まだまだ余裕がありそう！", "みんなに追いつきましょう。", "今日はまだ飲み足りない顔です。"],
+        'toast': ["みんな同じくらいなので一体感を！", "いい感じのバランスです、乾杯！", "場が温まってきました。"],
+        'none': ["今回は普通にどうぞ。", "流れに任せましょう。", "特に言うことなし！"],
+    }
+
+    def __init__(self, rng=None):
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def decide(self, selected_player, all_players):
+        """'exempt' / 'extra' / 'toast' / 'none' のいずれか"""
+        drunk = selected_player['drunk_degree']
+        others = [p['drunk_degree'] for p in all_players if p['name'] != selected_player['name']]
+        average = sum(others) / len(others) if others else drunk
+        spread = max(others + [drunk]) - min(others + [drunk])
+
+        if drunk >= 80:
+            return 'exempt'
+        if drunk <= average - 20 and selected_player['total_drunk'] < 5:
+            return 'extra'
+        if others and spread <= 15 and average >= 20:
+            return 'toast'
+        if drunk >= average + 25:
+            return 'exempt'
+        return 'none'
+
+    def generate(self, selected_player, all_players):
+        decision = self.decide(selected_player, all_players)
+        with self._lock:
+            reason = self._rng.choice(self.REASONS[decision])
+        name = selected_player['name']
+        if decision == 'exempt':
+            return f"{name}さんは「今回は免除」（飲まなくてよい）。{reason}"
+        if decision == 'extra':
+            return f"{name}さんは「追加で0.5杯飲む」（さらに飲む）。{reason}"
+        if decision == 'toast':
+            return f"「全員で乾杯」（みんなで少し飲む）。{reason}"
+        return f"「特別なことなし」（通常通り）。{reason}"
+
+class FakeBackend(AIEventBackend):
+    """遅延やエラーを注入できるテスト用のバックエンド
+
+    stream() は delay 秒後から chunk_size 文字ずつ chunk_delay 秒おきに返す。
+    """
+    name = "fake"
+
+    def __init__(self, delay=0.0, text="「特別なことなし」（通常通り）テスト用の提案です。", error=None,
+                 chunk_size=4, chunk_delay=0.0):
+        self.delay = delay
+        self.text = text
+        self.error = error
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+
+    def generate(self, selected_player, all_players):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    def generate_batch(self, players, cases):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {selected['name']: self.text for selected, _ in cases}
+
+    def stream(self, selected_player, all_players):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        for i in range(0, len(self.text), self.chunk_size):
+            if i and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield self.text[i:i + self.chunk_size]
+
+class CircuitBreaker:
+    """連続失敗・遅い応答が続いたら一定時間バックエンドを使わないようにする
+
+    closed（通常）→ 失敗が failure_threshold 回続くと open（使わない）→
+    reset_seconds 後に half_open（1回だけ試す）→ 成功で closed、失敗で再び open。
+    slow_call_seconds を超えた応答は成功でも失敗として数える。
+    """
+    def __init__(self, failure_threshold=3, slow_call_seconds=3.0, reset_seconds=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self._clock() - self._opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """今回バックエンドを呼んでよいか"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            # 試行が取り消されて戻ってこない場合に備え、古い試行は無視する
+            trial = self._trial_started_at
+            if state == 'half_open' and (trial is None or self._clock() - trial >= self.reset_seconds):
+                self._trial_started_at = self._clock()
+                return True
+            return False
+
+    def release(self):
+        """allow() 後に呼び出さなかったとき、結果を記録せずに枠を返す"""
+        with self._lock:
+            self._trial_started_at = None
+
+    def record(self, elapsed, ok=True):
+        """呼び出し結果を記録（elapsed は秒）"""
+        with self._lock:
+            self._trial_started_at = None
+            if ok and elapsed < self.slow_call_seconds:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+class AIEventDispatcher:
+    """AIイベント生成をバックグラウンドのスレッドプールで実行する
+
+    cache を渡すと、似た状況で生成済みの提案があればバックエンドを呼ばずに返す。
+    fallback を渡すと、バックエンドの失敗時やブレーカーが開いている間はそちらで生成する。
+    """
+    def __init__(self, backend, max_workers=4, cache=None, fallback=None, breaker=None):
+        self.backend = backend
+        self.fallback = fallback
+        self.breaker = breaker
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-event")
+
+    @property
+    def active_backend(self):
+        """次の呼び出しで使われる見込みのバックエンド"""
+        if self.fallback is not None and self.breaker is not None and self.breaker.state == 'open':
+            return self.fallback
+        return self.backend
+
+    def prefetch(self, players, cases):
+        """候補者全員の提案を1回のリクエストでまとめて先読みし、{名前: 提案文} の Future を返す
+
+        ブレーカーが開いている間や失敗時は空の dict になる（選ばれた後に通常どおり生成）。
+        """
+        players = [snapshot_player(p) for p in players]
+        cases = [(snapshot_player(selected), [snapshot_player(p) for p in all_players])
+                 for selected, all_players in cases]
+        if not cases or (self.breaker is not None and not self.breaker.allow()):
+            return self._completed({}, None, None)
+        return self._executor.submit(self._generate_batch, players, cases)
+
+    def _generate_batch(self, players, cases):
+        started = time.monotonic()
+        try:
+            suggestions = self.backend.generate_batch(players, cases)
+        except Exception:
+            if self.breaker is not None:
+                self.breaker.record(time.monotonic() - started, ok=False)
+            return {}
+        # まとめて頼んだ分は1件分より遅くて当然なので、失敗だけを数える
+        if self.breaker is not None:
+            self.breaker.record(0.0, ok=True)
+        if self.cache is not None:
+            for selected, all_players in cases:
+                text = suggestions.get(selected['name'])
+                template = cache_template(text, selected, all_players) if text else None
+                if template is not None:
+                    self.cache.put(ai_event_cache_key(selected, all_players), template)
+        return suggestions
+
+    def submit(self, selected_player, all_players, deadline=None, stream=None, prefetched=None):
+        """生成を投入して Future を返す（状況は呼び出し時点のものを使う）
+
+        deadline（time.time() 基準）を過ぎて届いた結果は None になる。
+        stream（AIEventStream）を渡すと、バックエンドのストリーミング生成で途中経過を書き込む。
+        prefetched（prefetch() の Future）に本人の提案があればそれを使う。
+        """
+        selected_player = snapshot_player(selected_player)
+        all_players = [snapshot_player(p) for p in all_players]
+        name = selected_player['name']
+        if prefetched is not None:
+            if prefetched.done():
+                text = self._prefetched_text(prefetched, name)
+                if text:
+                    return self._completed(text, stream, "batch")
+            else:
+                # 先読みがまだ届いていなければ、届いた時点で続きを行う
+                # （ワーカーで待つと、先読み自身と同じプールのスレッドを塞いでしまう）
+                future = Future()
+                prefetched.add_done_callback(
+                    lambda done: self._continue_after_prefetch(done, future, selected_player, all_players,
+                                                               deadline, stream))
+                return future
+
+        key, answered, text = self._quick_answer(selected_player, all_players, stream)
+        if answered:
+            future = Future()
+            future.set_result(text)
+            return future
+        return self._executor.submit(self._generate, selected_player, all_players, deadline, key, stream)
+
+    def _quick_answer(self, selected_player, all_players, stream):
+        """バックエンドを呼ばずに答えられるか調べ、(キャッシュキー, 答えたか, 提案文) を返す"""
+        key = None
+        if self.cache is not None:
+            key = ai_event_cache_key(selected_player, all_players)
+            cached = self.cache.get(key)
+            if cached is not None:
+                text = cached.replace(NAME_PLACEHOLDER, selected_player['name'])
+                self._completed(text, stream, "cache")
+                return key, True, text
+
+        if self.fallback is not None and self.breaker is not None and not self.breaker.allow():
+            # ブレーカーが開いている間はローカルで即座に生成（スレッドも使わない）
+            text = self._generate_fallback(selected_player, all_players, None, stream)
+            if stream is not None:
+                stream.finish(self.fallback.name)
+            return key, True, text
+        return key, False, None
+
+    @staticmethod
+    def _completed(text, stream, source):
+        if stream is not None:
+            if text:
+                stream.feed(text)
+            stream.finish(source)
+        future = Future()
+        future.set_result(text)
+        return future
+
+    @staticmethod
+    def _prefetched_text(prefetched, name):
+        if prefetched.cancelled() or prefetched.exception() is not None:
+            return None
+        return prefetched.result().get(name)
+
+    def _continue_after_prefetch(self, prefetched, future, selected_player, all_players, deadline, stream):
+        """先読みの完了時に呼ばれる。本人の提案があればそれを、無ければ個別の生成の結果を future に入れる
+
+        それまでに future が取り消されていれば（次のラウンドへ進んだなど）、誰も読まないので何も生成しない。
+        """
+        if not future.set_running_or_notify_cancel():
+            return
+        text = self._prefetched_text(prefetched, selected_player['name'])
+        if text:
+            if stream is not None:
+                stream.feed(text)
+                stream.finish("batch")
+            future.set_result(text)
+            return
+        if deadline is not None and time.time() >= deadline:
+            future.set_result(None)
+            return
+        key, answered, text = self._quick_answer(selected_player, all_players, stream)
+        if answered:
+            future.set_result(text)
+            return
+        try:
+            generation = self._executor.submit(self._generate, selected_player, all_players, deadline, key, stream)
+        except RuntimeError:
+            # shutdown() 後に先読みが届いた
+            future.set_result(None)
+            return
+        generation.add_done_callback(lambda done: self._forward(done, future))
+
+    @staticmethod
+    def _forward(source, target):
+        if target.done():
+            return
+        if source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    def _call_backend(self, selected_player, all_players, stream):
+        """バックエンドを呼び、(提案文, 最初の応答までの秒数) を返す"""
+        started = time.monotonic()
+        if stream is None:
+            text = self.backend.generate(selected_player, all_players)
+            return text, time.monotonic() - started
+
+        first_token = None
+        for chunk in self.backend.stream(selected_player, all_players):
+            if first_token is None:
+                first_token = time.monotonic() - started
+                # 先頭の空白・改行は表示しない
+                chunk = chunk.lstrip()
+            stream.feed(chunk)
+        return stream.text.strip(), first_token if first_token is not None else time.monotonic() - started
+
+    def _generate(self, selected_player, all_players, deadline, key=None, stream=None):
+        if deadline is not None and time.time() >= deadline:
+            if self.breaker is not None:
+                self.breaker.release()
+            return None
+        started = time.monotonic()
+        try:
+            text, latency = self._call_backend(selected_player, all_players, stream)
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record(time.monotonic() - started, ok=False)
+            if self.fallback is None:
+                text = f"AIイベント生成エラー: {str(e)[:50]}..."
+                if stream is not None:
+                    stream.reset()
+                    stream.feed(text)
+                    stream.finish(self.backend.name)
+                return text
+            text = self._generate_fallback(selected_player, all_players, deadline, stream)
+            if stream is not None:
+                stream.finish(self.fallback.name)
+            return text
+
+        # ストリーミング時は体感の遅さ（最初の応答まで）で遅延を判定する
+        if self.breaker is not None:
+            self.breaker.record(latency, ok=True)
+        if stream is not None:
+            stream.finish(self.backend.name)
+        # 締め切りに間に合わなくても次の似た状況のために残す（エラーは残さない）
+        template = cache_template(text, selected_player, all_players) if key is not None and text else None
+        if template is not None:
+            self.cache.put(key, template)
+        if deadline is not None and time.time() >= deadline:
+            return None
+        return text
+
+    def _generate_fallback(self, selected_player, all_players, deadline, stream=None):
+        try:
+            text = self.fallback.generate(selected_player, all_players)
+        except Exception as e:
+            text = f"AIイベント生成エラー: {str(e)[:50]}..."
+        if stream is not None:
+            stream.reset()
+            stream.feed(text)
+        if deadline is not None and time.time() >= deadline:
+            return None
+        return text
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
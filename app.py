@@ -1,46 +1,201 @@
 import streamlit as st
-import streamlit.components.v1 as components
-import random
+import functools
 import time
+import uuid
+from collections import deque
 
-# AIモジュール（オプション）
-try:
-    import google.generativeai as genai
-    AI_AVAILABLE = True
-except ImportError:
-    AI_AVAILABLE = False
-    st.warning("⚠️ google-generativeai がインストールされていません。AI機能なしで動作します。")
+import numpy as np
+
+from ai_events import (AIEventCache, AIEventDispatcher, AIEventStream, CircuitBreaker, FakeBackend, GeminiBackend,
+                       GeminiLoader, RuleBasedBackend, gemini_installed)
+from game_engine import (DIFFICULTY_ROUNDS, GameEngine, analyze_game_balance, calculate_drink_amount,
+                         get_drink_display, load_weight_profiles)
+from game_store import DEFAULT_DB_PATH, GameStore
+from history_columns import DEFAULT_HISTORY_DIR, ColumnarHistory, downsample
+from instrumentation import MetricsRegistry, NullTrace, RerunTrace
+from rooms import RoomState, RoomStore
+from roster import PlayerRoster
+from roulette_component import forget_layout, roulette
+
+# AIモジュール（オプション）。SDK 本体は重いので、ここでは入っているかだけ調べる
+AI_AVAILABLE = gemini_installed()
+if not AI_AVAILABLE:
+    st.warning("⚠️ google-generativeai がインストールされていません。ローカルのルールでAIイベントを生成します。")
 
 # ページ設定
 st.set_page_config(page_title="🍶 バランサールーレット2.0", page_icon="🍶", layout="wide")
 
-# Gemini API設定（オプション）
-GEMINI_API_KEY = None
-if AI_AVAILABLE:
-    GEMINI_API_KEY = st.secrets.get("GEMINI_API_KEY")
-    if GEMINI_API_KEY:
-        try:
-            genai.configure(api_key=GEMINI_API_KEY)
-        except Exception as e:
-            st.error(f"Gemini API設定エラー: {e}")
-            GEMINI_API_KEY = None
+def get_secret(key, default=None):
+    """secrets.toml が無い環境でも安全に設定値を取得"""
+    try:
+        return st.secrets.get(key, default)
+    except FileNotFoundError:
+        return default
+
+# Gemini API設定（オプション）。読み込みと設定は初回の生成か、初回描画後の先読みで行う
+GEMINI_API_KEY = get_secret("GEMINI_API_KEY") if AI_AVAILABLE else None
+
+# AIイベントの締め切り（秒）。これを過ぎて届いた提案は破棄する
+AI_EVENT_DEADLINE_SECONDS = float(get_secret("AI_EVENT_DEADLINE_SECONDS", 8.0))
+
+# ローカル検証用：指定すると遅延を注入した偽バックエンドでAIイベントを生成（秒）
+AI_FAKE_MODEL_DELAY = get_secret("AI_FAKE_MODEL_DELAY")
+AI_FAKE_CHUNK_DELAY = float(get_secret("AI_FAKE_CHUNK_DELAY", 0.05))
+
+# 提案を届いた分から少しずつ表示する（ストリーミング生成）
+AI_STREAMING = bool(get_secret("AI_STREAMING", True))
+
+# 待機中に次のラウンドの候補者全員分の提案を1回のリクエストで先読みする（人数の上限つき）
+AI_BATCH_PREFETCH = bool(get_secret("AI_BATCH_PREFETCH", False))
+AI_BATCH_MAX_PLAYERS = int(get_secret("AI_BATCH_MAX_PLAYERS", 20))
+
+# Gemini の連続失敗・遅延がこの回数続いたらローカル生成に切り替え、一定時間後に再試行
+AI_BREAKER_FAILURES = int(get_secret("AI_BREAKER_FAILURES", 3))
+AI_BREAKER_SLOW_SECONDS = float(get_secret("AI_BREAKER_SLOW_SECONDS", 3.0))
+AI_BREAKER_RESET_SECONDS = float(get_secret("AI_BREAKER_RESET_SECONDS", 60.0))
+
+# AIイベントのキャッシュ：有効期限（秒）と、似た状況ごとに保持する提案の数
+AI_CACHE_TTL_SECONDS = float(get_secret("AI_CACHE_TTL_SECONDS", 1800.0))
+AI_CACHE_VARIANTS = int(get_secret("AI_CACHE_VARIANTS", 3))
+
+# 計測：'spans' で区間の時間、'profile' で cProfile も取ってサイドバーに表示（URL の ?instrument= でも指定可）
+INSTRUMENTATION = get_secret("INSTRUMENTATION", "")
+# カウンタ・ヒストグラムを Prometheus のテキスト形式で書き出すファイル、または /metrics を返すポート
+METRICS_FILE = get_secret("METRICS_FILE")
+METRICS_PORT = get_secret("METRICS_PORT")
+
+@st.cache_resource
+def get_metrics():
+    """全セッションで共有するメトリクス（ポート指定があれば /metrics も公開）"""
+    metrics = MetricsRegistry()
+    metrics.describe("span_seconds", "Server-side time per instrumented span")
+    metrics.describe("reruns_total", "Completed full-script reruns")
+    metrics.describe("rounds_total", "Roulette spins")
+    metrics.describe("ai_events_total", "AI suggestions delivered, by source")
+    if METRICS_PORT:
+        metrics.serve(int(METRICS_PORT))
+    return metrics
+
+def start_trace():
+    """この再実行の計測を始める（無効なら何もしない NullTrace）"""
+    # 前回の再実行が途中で打ち切られていたら、その cProfile を止めてから始める
+    previous = st.session_state.get('trace')
+    if previous is not None:
+        previous.stop()
+    mode = st.query_params.get("instrument") or INSTRUMENTATION
+    if not mode and not METRICS_FILE and not METRICS_PORT:
+        trace = NullTrace()
+    else:
+        trace = RerunTrace(get_metrics(), profile=mode == 'profile')
+    st.session_state.trace = trace
+    return trace
+
+def current_trace():
+    """いまの計測。フラグメント単独の再実行ではモジュールの trace が古いままなので、毎回セッションから引く"""
+    trace = st.session_state.get('trace')
+    return trace if trace is not None else NullTrace()
+
+@st.cache_resource
+def get_gemini_loader():
+    """全セッションで共有する Gemini SDK の遅延ローダー"""
+    return GeminiLoader(GEMINI_API_KEY)
+
+@st.cache_resource
+def get_ai_event_dispatcher():
+    """全セッションで共有するAIイベント生成エグゼキュータ（提案キャッシュ・ローカル切り替え付き）"""
+    local = RuleBasedBackend()
+    if AI_FAKE_MODEL_DELAY is not None:
+        backend = FakeBackend(delay=float(AI_FAKE_MODEL_DELAY), chunk_delay=AI_FAKE_CHUNK_DELAY)
+    elif GEMINI_API_KEY and AI_AVAILABLE:
+        backend = GeminiBackend(get_gemini_loader().model)
+    else:
+        # 外部APIが無いのでローカル生成のみ（キャッシュ・ブレーカーは不要）
+        return AIEventDispatcher(local)
+    cache = AIEventCache(ttl_seconds=AI_CACHE_TTL_SECONDS, variants=AI_CACHE_VARIANTS)
+    breaker = CircuitBreaker(failure_threshold=AI_BREAKER_FAILURES, slow_call_seconds=AI_BREAKER_SLOW_SECONDS,
+                             reset_seconds=AI_BREAKER_RESET_SECONDS)
+    return AIEventDispatcher(backend, cache=cache, fallback=local, breaker=breaker)
+
+# 回転完了通知が届かない場合のサーバー側タイムアウト（秒）
+SPIN_TIMEOUT_SECONDS = 6.0
+
+# 参加人数の上限。AUTO_SVG_THRESHOLD を超える人数ではルーレットが SVG 描画に切り替わる
+# 入力画面は1人につき4つの入力欄を作り、どれかを変えるたびに全員分を描き直す。
+# 200人で1回あたり約0.5秒（500人では約2秒）なので、手入力で扱える範囲としてここで止める
+MAX_PLAYERS = 200
+# これより多いときは、入力欄を閉じた状態で並べる
+EXPANDED_INPUT_PLAYERS = 12
+
+@st.cache_resource
+def get_weight_profiles():
+    """難易度別の公平ウェイト（起動時に一度だけ読み込み）"""
+    return load_weight_profiles()
+
+@st.cache_resource
+def get_game_store():
+    """全セッションで共有する名簿・対戦履歴の保存先"""
+    return GameStore(get_secret("GAME_DB_PATH", DEFAULT_DB_PATH))
+
+@st.cache_resource
+def get_history():
+    """全セッションで共有する列形式の履歴（分析用）"""
+    return ColumnarHistory(get_secret("HISTORY_DIR", DEFAULT_HISTORY_DIR))
+
+@st.cache_resource
+def get_room_store():
+    """全セッションで共有する観戦ルームの一覧"""
+    return RoomStore()
+
+def new_engine(players, roster_id=None):
+    """選択中の難易度でゲームエンジンを作成し、名簿とゲームを保存"""
+    difficulty = st.session_state.difficulty
+    discard_ai_prefetch()
+    engine = GameEngine(players, max_rounds=st.session_state.max_rounds,
+                        params=get_weight_profiles()[difficulty])
+    if roster_id is None:
+        roster_id = get_game_store().save_roster(engine.players)
+    st.session_state.roster_id = roster_id
+    start_recording(engine)
+    return engine
+
+def start_recording(engine):
+    """ゲーム開始（やり直しを含む）を保存"""
+    st.session_state.game_id = get_game_store().start_game(
+        st.session_state.roster_id, engine.seed, engine.max_rounds, st.session_state.difficulty)
+    st.session_state.auto_play_summary = None
 
 # セッション状態の初期化
 def init_session_state():
     defaults = {
         'game_state': 'menu',
-        'players': [],
-        'saved_players': [],
-        'round_count': 0,
-        'max_rounds': 15,
+        'engine': None,
+        'saved_players': None,
+        'roster_id': None,
+        'game_id': None,
+        'difficulty': 'normal',
+        'max_rounds': DIFFICULTY_ROUNDS['normal'],
         'spinning': False,
+        'spin_id': None,
+        'spin_started_at': None,
         'selected_player_index': None,
         'selected_special': None,
         'last_selected': None,
         'last_drink': None,
         'last_special_effect': None,
         'ai_event_description': None,
-        'special_effects_active': {}
+        'ai_event_future': None,
+        'ai_event_deadline': None,
+        'ai_event_round': None,
+        'ai_event_stream': None,
+        'ai_event_metrics': None,
+        'ai_prefetch_future': None,
+        'ai_prefetch_round': None,
+        'render_timings': {},
+        'auto_play_summary': None,
+        'room_code': None,
+        'room_host_token': None,
+        'spectate_code': None,
+        'viewer_id': uuid.uuid4().hex
     }
     
     for key, default_value in defaults.items():
@@ -49,415 +204,502 @@ def init_session_state():
 
 init_session_state()
 
-def calculate_drink_amount(player, multiplier=1.0):
-    """飲み量を計算（倍率対応）"""
-    strength = player['strength']
-    preference = player['preference']
-    
-    if strength <= 2:
-        if preference <= 2: base_multiplier = 0.5
-        elif preference == 3: base_multiplier = 0.75
-        else: base_multiplier = 1.0
-    elif strength == 3:
-        if preference <= 2: base_multiplier = 0.75
-        elif preference == 3: base_multiplier = 1.0
-        else: base_multiplier = 1.5
-    else:
-        if preference <= 3: base_multiplier = 1.5
-        else: base_multiplier = 2.0
+def prefetch_ai_events(engine):
+    """待機中に、このラウンドで選ばれうる人全員分の提案をまとめて先読み"""
+    dispatcher = get_ai_event_dispatcher()
+    if not AI_BATCH_PREFETCH or dispatcher.backend.name == 'local':
+        return
+    if st.session_state.ai_prefetch_round == engine.round_count:
+        return
     
-    return base_multiplier * multiplier
+    cases = [engine.preview_drink(i) for i in engine.likely_candidates(AI_BATCH_MAX_PLAYERS)]
+    st.session_state.ai_prefetch_future = dispatcher.prefetch(engine.players, cases)
+    st.session_state.ai_prefetch_round = engine.round_count
 
-def get_drink_display(multiplier, cup_type):
-    """飲み物の表示"""
-    if cup_type == 'おちょこ':
-        return f"おちょこ {multiplier:.1f}杯"
-    elif cup_type == 'ジョッキ':
-        return f"ジョッキ {multiplier*0.5:.1f}杯分"
-    else:
-        return f"おちょこ {multiplier:.1f}杯（またはジョッキ {multiplier*0.5:.1f}杯分）"
-
-def update_drunk_degree(player, multiplier):
-    """酔い度を更新"""
-    player['drunk_degree'] += multiplier * 10
-    player['drunk_degree'] = min(player['drunk_degree'], 100)
-    player['total_drunk'] += multiplier
-
-def calculate_player_weight(player):
-    """公平性を考慮した重み計算"""
-    # 酔い度が低いほど重くなる公平ウェイト
-    base = 0.4 + (1.0 - player["drunk_degree"]/100.0) * 1.2
-    # 個人特性による微調整
-    adj = 1.0 + (5 - player["strength"]) * 0.05 + (player["preference"] - 3) * 0.05
-    weight = max(0.1, base * adj)
-    return weight
-
-def smart_player_selection(players):
-    """AI強化版プレイヤー選択"""
-    # 特別セクション判定（15%の確率）
-    if random.random() < 0.15:
-        special_types = ['shield', 'double', 'everyone']
-        selected_special = random.choice(special_types)
-        return None, selected_special
-    
-    # 通常のプレイヤー選択（重み付きランダム）
-    weights = [calculate_player_weight(p) for p in players]
-    selected_player = random.choices(players, weights=weights)[0]
-    selected_index = players.index(selected_player)
-    
-    return selected_index, None
+def discard_ai_prefetch():
+    """先読み中の提案を破棄"""
+    future = st.session_state.get('ai_prefetch_future')
+    if future is not None:
+        future.cancel()
+    st.session_state.ai_prefetch_future = None
+    st.session_state.ai_prefetch_round = None
 
 def generate_ai_event(selected_player, all_players):
-    """AI による追加イベント生成"""
-    if not GEMINI_API_KEY or not AI_AVAILABLE:
-        return None
+    """AI による追加イベント生成（バックグラウンドで実行し、結果は後で回収）"""
+    deadline = time.time() + AI_EVENT_DEADLINE_SECONDS
+    stream = AIEventStream() if AI_STREAMING else None
+    # 回転前のラウンドで先読みした提案があれば使う
+    prefetched = None
+    if st.session_state.ai_prefetch_round == st.session_state.engine.round_count - 1:
+        prefetched = st.session_state.ai_prefetch_future
+    future = get_ai_event_dispatcher().submit(selected_player, all_players, deadline=deadline, stream=stream,
+                                              prefetched=prefetched)
+    st.session_state.ai_event_future = future
+    st.session_state.ai_event_stream = stream
+    st.session_state.ai_event_deadline = deadline
+    st.session_state.ai_event_round = st.session_state.engine.round_count
+    return future
+
+def discard_ai_event():
+    """保留中のAIイベントを破棄"""
+    future = st.session_state.ai_event_future
+    if future is not None:
+        future.cancel()
+    st.session_state.ai_event_future = None
+    st.session_state.ai_event_deadline = None
+    st.session_state.ai_event_round = None
+    st.session_state.ai_event_stream = None
+
+def poll_ai_event():
+    """保留中のAIイベントを回収（締め切り超過なら破棄）。状態が変わったら True"""
+    future = st.session_state.ai_event_future
+    if future is None:
+        return False
     
-    try:
-        # 他のプレイヤーの状況を要約
-        other_status = []
-        for p in all_players:
-            if p['name'] != selected_player['name']:
-                other_status.append(f"{p['name']}: 酔い度{p['drunk_degree']:.1f}%")
-        
-        other_info = ", ".join(other_status) if other_status else "他にプレイヤーなし"
-        
-        prompt = f"""
-        飲みゲームのAIマスターとして、ゲームを盛り上げる追加イベントを提案してください。
-        
-        選ばれたプレイヤー: {selected_player['name']}
-        酔い度: {selected_player['drunk_degree']:.1f}%
-        総飲酒量: {selected_player['total_drunk']:.1f}杯
-        
-        他のプレイヤー: {other_info}
-        
-        以下のいずれかの形式で簡潔に提案してください：
-        - 「追加で0.5杯飲む」（さらに飲む）
-        - 「今回は免除」（飲まなくてよい）
-        - 「全員で乾杯」（みんなで少し飲む）
-        - 「特別なことなし」（通常通り）
-        
-        理由も一言で添えてください。
-        """
+    if future.done():
+        same_round = st.session_state.ai_event_round == st.session_state.engine.round_count
+        if same_round and not future.cancelled() and future.result():
+            st.session_state.ai_event_description = future.result()
+            stream = st.session_state.ai_event_stream
+            if stream is not None and stream.done and stream.first_token_seconds is not None:
+                # 生成は裏のスレッドで終わっているので、かかった時間を届いたこの再実行で記録する
+                trace = current_trace()
+                trace.record('ai_call', stream.total_seconds)
+                trace.count('ai_events_total', source=stream.source)
+                st.session_state.ai_event_metrics = {
+                    'source': stream.source,
+                    'first_token_seconds': stream.first_token_seconds,
+                    'total_seconds': stream.total_seconds,
+                }
+        discard_ai_event()
+        return True
+    
+    if time.time() >= st.session_state.ai_event_deadline:
+        discard_ai_event()
+        return True
+    
+    return False
+
+# 描画時間の表示名（サーバー側で Python が画面を組み立てるのにかかった時間）
+RENDER_TIMING_LABELS = {
+    'page': "画面全体",
+    'status': "ステータス",
+    'analysis': "AI分析",
+    'result': "結果表示",
+}
+# 直近何回分の描画時間を残すか
+RENDER_TIMING_SAMPLES = 50
+
+def record_render_time(kind, seconds):
+    """描画時間を種類ごとに記録"""
+    timings = st.session_state.render_timings
+    if kind not in timings:
+        timings[kind] = deque(maxlen=RENDER_TIMING_SAMPLES)
+    timings[kind].append(seconds)
+
+def timed_render(kind):
+    """関数の実行（フラグメント単独の再実行を含む）にかかった時間を記録するデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                record_render_time(kind, seconds)
+                current_trace().record(f"{kind}_render", seconds)
+        return wrapper
+    return decorator
+
+def display_enhanced_status(engine):
+    """強化されたステータス表示（各パネルはフラグメントとして単独で再実行される）"""
+    st.markdown("---")
+    
+    col1, col2 = st.columns([3, 2])
+    
+    with col1:
+        status_board(engine)
+    
+    with col2:
+        ai_analysis_panel(engine)
+
+@st.fragment
+@timed_render('status')
+def status_board(engine):
+    """酔い度の一覧。並び順の切り替えではこのパネルだけを描き直す"""
+    st.subheader("📊 現在の酔い度")
+    order = st.radio("並び順", ["酔い度順", "期待比のずれ順", "登録順"], horizontal=True,
+                     key="status_order", label_visibility="collapsed")
+    
+    ranking = engine.players.ranking()
+    gaps = engine.share_gaps()
+    ranks = {p.index: i for i, p in enumerate(ranking, 1)}
+    if order == "期待比のずれ順":
+        rows = sorted(ranking, key=lambda p: -gaps[p.index])
+    elif order == "登録順":
+        rows = list(engine.players)
+    else:
+        rows = ranking
+    
+    for p in rows:
+        i = ranks[p.index]
+        col_rank, col_name, col_progress, col_stats = st.columns([1, 2, 3, 2])
         
-        response = genai.GenerativeModel('gemini-pro').generate_content(prompt)
-        return response.text.strip()
+        with col_rank:
+            medals = ["", "🥇", "🥈", "🥉"]
+            medal = medals[i] if i <= 3 else f"{i}位"
+            st.write(medal)
         
-    except Exception as e:
-        return f"AIイベント生成エラー: {str(e)[:50]}..."
-
-def process_special_effect(special_type, players):
-    """特別効果の処理"""
-    if special_type == 'shield':
-        target = random.choice(players)
-        if target['name'] not in st.session_state.special_effects_active:
-            st.session_state.special_effects_active[target['name']] = {}
-        st.session_state.special_effects_active[target['name']]['shield'] = True
-        return f"🛡️ **{target['name']}**さんにシールドが付与されました！"
+        with col_name:
+            shield_icon = "🛡️" if engine.has_shield(p['name']) else ""
+            st.write(f"**{shield_icon}{p['name']}**")
         
-    elif special_type == 'double':
-        target = random.choice(players)
-        multiplier = calculate_drink_amount(target, 2.0)
-        drink_info = get_drink_display(multiplier, target['cup_type'])
-        update_drunk_degree(target, multiplier)
-        return f"⚡ **{target['name']}**さんが倍々アタック！{drink_info}"
+        with col_progress:
+            st.progress(p['drunk_degree'] / 100)
         
-    elif special_type == 'everyone':
-        for player in players:
-            update_drunk_degree(player, 0.5)
-        return "🍻 みんなで乾杯！全員でおちょこ半分ずつ飲みましょう！"
-    
-    return "特別効果が発生しました！"
-
-def create_enhanced_roulette_html(players, selected_index=None, selected_special=None, spinning=False):
-    """進化したルーレットHTML生成"""
-    num_players = len(players)
-    colors = ['#FF6666', '#4ECDCA', '#4587D1', '#FFA07A', '#98D8C8',
-              '#F7DC6F', '#88BFCE', '#B5C1E2', '#B8B195', '#C8C6B4',
-              '#6C5E7B', '#355C70']
-    
-    # 特別セクションも含めた全セクション数
-    special_sections = 3
-    total_sections = num_players + special_sections
-    angle_per_section = 360 / total_sections
-    
-    # グラデーション作成
-    gradient_stops = []
-    section_index = 0
-    
-    # プレイヤーセクション
-    for i in range(num_players):
-        start_angle = section_index * angle_per_section
-        end_angle = (section_index + 1) * angle_per_section
-        color = colors[i % len(colors)]
-        gradient_stops.append(f"{color} {start_angle}deg {end_angle}deg")
-        section_index += 1
-    
-    # 特別セクション
-    special_colors = ['#3498db', '#e74c3c', '#f39c12']  # シールド、倍々、みんなで乾杯
-    for i, color in enumerate(special_colors):
-        start_angle = section_index * angle_per_section
-        end_angle = (section_index + 1) * angle_per_section
-        gradient_stops.append(f"{color} {start_angle}deg {end_angle}deg")
-        section_index += 1
-    
-    gradient = ", ".join(gradient_stops)
-    
-    # 回転角度の計算
-    if selected_index is not None:
-        target_angle = -(selected_index * angle_per_section + angle_per_section / 2)
-        if spinning:
-            total_rotation = target_angle + random.randint(1440, 2160)  # 4-6回転
-        else:
-            total_rotation = target_angle
-    elif selected_special is not None:
-        special_map = {'shield': 0, 'double': 1, 'everyone': 2}
-        special_index = num_players + special_map.get(selected_special, 0)
-        target_angle = -(special_index * angle_per_section + angle_per_section / 2)
-        if spinning:
-            total_rotation = target_angle + random.randint(1440, 2160)
-        else:
-            total_rotation = target_angle
-    else:
-        total_rotation = 0
+        with col_stats:
+            st.write(f"{p['drunk_degree']:.1f}%")
+            st.caption(f"{p['total_drunk']:.1f}杯（期待比 {gaps[p.index]:+.1f}pt）")
+
+@st.fragment
+@timed_render('analysis')
+def ai_analysis_panel(engine):
+    """バランス分析とAI機能の状態
+
+    定期更新はしない。キャッシュやサーキットブレーカーが変わるのはAIイベントの生成時だけなので、
+    ラウンドの進行と、提案が届いたときの再実行で描き直す。
+    """
+    st.subheader("🤖 AI分析")
+    analysis = analyze_game_balance(engine.players, engine.round_count, engine.expected_shares)
+    st.markdown(analysis)
     
-    # ラベル生成
-    labels_html = ""
+    # AI機能の状態表示
+    dispatcher = get_ai_event_dispatcher()
+    backend_labels = {'gemini': "Gemini", 'local': "ローカル", 'fake': "テスト"}
+    if dispatcher.active_backend is dispatcher.backend:
+        st.success(f"✅ AI機能: 有効（{backend_labels[dispatcher.backend.name]}）")
+    else:
+        st.info("ℹ️ AI機能: 応答が不安定なため一時的にローカル生成中")
+    if dispatcher.cache is not None:
+        cache_info = dispatcher.cache.info()
+        st.caption(f"提案キャッシュ: ヒット {cache_info.hits} / ミス {cache_info.misses}"
+                   f"（{cache_info.size}件）")
     
-    # プレイヤーラベル
-    for i, player in enumerate(players):
-        label_angle = i * angle_per_section + angle_per_section / 2
-        name = str(player['name']).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    with st.expander("🔧 デバッグ指標"):
+        metrics = st.session_state.ai_event_metrics
+        if metrics:
+            st.write(f"直前の提案: {metrics['source']}")
+            st.write(f"最初のトークンまで: {metrics['first_token_seconds'] * 1000:.0f}ms")
+            st.write(f"完了まで: {metrics['total_seconds'] * 1000:.0f}ms")
+        loader = get_gemini_loader()
+        if loader.import_seconds is not None:
+            st.write(f"Gemini SDK 読み込み: {loader.import_seconds * 1000:.0f}ms")
         
-        # シールド効果の表示
-        shield_icon = "🛡️" if st.session_state.special_effects_active.get(player['name'], {}).get('shield', False) else ""
-        
-        labels_html += f"""
-        <div class="player-label" style="--angle: {label_angle}deg;">
-            <span>{shield_icon}{name}</span>
-        </div>
-        """
-    
-    # 特別セクションラベル
-    special_names = ['🛡️ シールド', '⚡ 倍々', '🍻 乾杯']
-    for i, special_name in enumerate(special_names):
-        label_angle = (num_players + i) * angle_per_section + angle_per_section / 2
-        
-        labels_html += f"""
-        <div class="special-label" style="--angle: {label_angle}deg;">
-            <span>{special_name}</span>
-        </div>
-        """
-    
-    html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        body {{
-            margin: 0;
-            padding: 0;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            min-height: 100vh;
-            background: transparent;
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-        }}
-        .roulette-container {{
-            position: relative;
-            width: 500px;
-            height: 500px;
-        }}
-        .arrow {{
-            position: absolute;
-            top: -25px;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 25px solid transparent;
-            border-right: 25px solid transparent;
-            border-top: 50px solid #e74c3c;
-            filter: drop-shadow(0 8px 16px rgba(0,0,0,0.4));
-            z-index: 30;
-        }}
-        #wheel {{
-            position: relative;
-            width: 100%;
-            height: 100%;
-            border-radius: 50%;
-            background: conic-gradient({gradient});
-            border: 5px solid #2c3e50;
-            box-shadow: 0 25px 70px rgba(0,0,0,0.4);
-            overflow: visible;
-            transform: rotate(0deg);
-            transition: transform 0.1s ease;
-            z-index: 5;
-        }}
-        .player-label, .special-label {{
-            position: absolute;
-            top: 50%;
-            left: 50%;
-            transform: rotate(var(--angle)) translateY(-200px) rotate(calc(-1 * var(--angle)));
-            transform-origin: center center;
-            pointer-events: none;
-        }}
-        .player-label span, .special-label span {{
-            display: inline-block;
-            padding: 6px 14px;
-            color: white;
-            font-weight: bold;
-            font-size: 14px;
-            text-shadow: 2px 2px 8px rgba(0,0,0,0.9);
-            white-space: nowrap;
-            max-width: 120px;
-            overflow: hidden;
-            text-overflow: ellipsis;
-            text-align: center;
-            background: rgba(0,0,0,0.4);
-            border-radius: 15px;
-            backdrop-filter: blur(6px);
-            border: 2px solid rgba(255,255,255,0.3);
-        }}
-        .special-label span {{
-            background: rgba(255,215,0,0.3);
-            border: 2px solid rgba(255,215,0,0.6);
-            font-size: 12px;
-        }}
-        .center-circle {{
-            position: absolute;
-            top: 50%;
-            left: 50%;
-            transform: translate(-50%, -50%);
-            width: 90px;
-            height: 90px;
-            background: linear-gradient(135deg, #f39c12, #e67e22);
-            border: 5px solid white;
-            border-radius: 50%;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 32px;
-            box-shadow: 0 8px 25px rgba(0,0,0,0.4);
-            z-index: 20;
-        }}
-    </style>
-</head>
-<body>
-    <div class="roulette-container">
-        <div class="arrow"></div>
-        <div id="wheel">
-            {labels_html}
-        </div>
-        <div class="center-circle">🍶</div>
-    </div>
-    
-    <script>
-        (function() {{
-            const wheel = document.getElementById('wheel');
-            const spinning = {str(spinning).lower()};
-            const targetRotation = {total_rotation};
-            
-            if (spinning) {{
-                wheel.style.transition = 'none';
-                wheel.style.transform = 'rotate(0deg)';
-                
-                requestAnimationFrame(() => {{
-                    requestAnimationFrame(() => {{
-                        wheel.style.transition = 'transform 4s cubic-bezier(0.25, 0.1, 0.25, 1)';
-                        wheel.style.transform = `rotate(${{targetRotation}}deg)`;
-                    }});
-                }});
-            }} else {{
-                wheel.style.transition = 'transform 0.6s ease-out';
-                wheel.style.transform = `rotate(${{targetRotation}}deg)`;
-            }}
-        }})();
-    </script>
-</body>
-</html>"""
-    return html_content
-
-def analyze_game_balance():
-    """ゲームバランス分析"""
-    if len(st.session_state.players) < 2:
-        return "分析データが不足しています。"
-    
-    drunk_degrees = [p['drunk_degree'] for p in st.session_state.players]
-    avg_drunk = sum(drunk_degrees) / len(drunk_degrees)
-    max_drunk = max(drunk_degrees)
-    min_drunk = min(drunk_degrees)
-    
-    if max_drunk == min_drunk:
-        balance_score = 100
-    else:
-        balance_score = max(0, 100 - (max_drunk - min_drunk))
+        # サーバー側の描画時間（直近の中央値と最大）
+        for kind, label in RENDER_TIMING_LABELS.items():
+            samples = st.session_state.render_timings.get(kind)
+            if samples:
+                ms = np.array(samples) * 1000
+                st.write(f"描画 {label}: 中央値 {np.median(ms):.1f}ms / 最大 {ms.max():.1f}ms（{len(ms)}回）")
+
+def display_history_analytics():
+    """過去のゲーム全体の分析（集計は列データのベクトル演算、グラフは間引いて描画）"""
+    # plotly は重いので、この画面を開いたときだけ読み込む
+    import plotly.graph_objects as go
     
-    analysis = f"""
-    **🎯 ゲームバランス分析（ラウンド {st.session_state.round_count}）**
+    started = time.perf_counter()
+    frame = get_history().load()
+    if not len(frame):
+        st.info("まだ終了したゲームがありません。")
+        return
     
-    **バランススコア**: {balance_score:.1f}/100
-    **平均酔い度**: {avg_drunk:.1f}%
-    **最大差**: {max_drunk - min_drunk:.1f}%
-    """
+    times, final_scores = frame.final_balance()
+    rounds, round_scores = frame.balance_by_round_number()
+    names, observed, expected, played = frame.selection_vs_model()
+    specials = frame.special_frequency()
     
-    if balance_score >= 80:
-        analysis += "\n✅ **素晴らしいバランス**です！"
-    elif balance_score >= 60:
-        analysis += "\n⚖️ **良好なバランス**です。"
-    elif balance_score >= 40:
-        analysis += "\n⚠️ **やや不均衡**です。"
-    else:
-        analysis += "\n🚨 **バランス調整中**です。"
+    col1, col2, col3 = st.columns(3)
+    col1.metric("ゲーム数", f"{len(final_scores):,}")
+    col2.metric("ラウンド数", f"{frame.num_rounds:,}")
+    col3.metric("平均最終バランス", f"{final_scores.mean():.1f}")
+    
+    # 最終バランスの推移（バケットごとの平均と最小〜最大の帯）
+    x, mean, low, high = downsample(times, final_scores)
+    dates = x.astype('datetime64[s]')
+    trend = go.Figure([
+        go.Scatter(x=dates, y=high, mode='lines', line={'width': 0}, showlegend=False, hoverinfo='skip'),
+        go.Scatter(x=dates, y=low, mode='lines', line={'width': 0}, fill='tonexty', name="最小〜最大"),
+        go.Scatter(x=dates, y=mean, mode='lines', name="平均"),
+    ])
+    trend.update_layout(title="最終バランススコアの推移", yaxis_range=[0, 100], height=350)
+    st.plotly_chart(trend, use_container_width=True)
+    
+    by_round = go.Figure(go.Scatter(x=rounds, y=round_scores, mode='lines+markers'))
+    by_round.update_layout(title="ラウンドごとの平均バランススコア", xaxis_title="ラウンド", height=300)
+    st.plotly_chart(by_round, use_container_width=True)
     
-    return analysis
+    # 選ばれた回数と重みモデルの期待値（参加ラウンドの多い順に上位30人）
+    top = np.argsort(-played, kind='stable')[:30]
+    selection = go.Figure([
+        go.Bar(x=[names[i] for i in top], y=observed[top], name="実際"),
+        go.Bar(x=[names[i] for i in top], y=expected[top], name="重みモデルの期待値"),
+    ])
+    selection.update_layout(title="選ばれた回数（実際と期待値）", barmode='group', height=350)
+    st.plotly_chart(selection, use_container_width=True)
+    
+    labels = {'shield': "🛡️ シールド", 'double': "⚡ 倍々", 'everyone': "🍻 みんなで乾杯"}
+    special_chart = go.Figure(go.Bar(x=[labels[k] for k in specials], y=[rate * 100 for _, rate in specials.values()],
+                                     text=[f"{count:,}回" for count, _ in specials.values()]))
+    special_chart.update_layout(title="特別セクションの発生率（%）", height=300)
+    st.plotly_chart(special_chart, use_container_width=True)
+    
+    st.caption(f"集計・グラフ作成: {(time.perf_counter() - started) * 1000:.0f}ms（{len(frame):,}行）")
 
-def display_enhanced_status():
-    """強化されたステータス表示"""
-    st.markdown("---")
+def undo_round():
+    """直前のラウンドを取り消してゲーム画面に戻る（押し間違い用）"""
+    engine = st.session_state.engine
+    engine.undo()
+    get_game_store().truncate_rounds(st.session_state.game_id, engine.round_count)
+    st.session_state.game_state = 'playing'
+    st.session_state.selected_player_index = None
+    st.session_state.selected_special = None
+    st.session_state.last_selected = None
+    st.session_state.last_special_effect = None
+    st.session_state.ai_event_description = None
+    st.session_state.auto_play_summary = None
+    discard_ai_event()
+
+def auto_play_rest():
+    """残りのラウンドを演出・AI提案なしでまとめて進め、ラウンドごとの要約を残す"""
+    engine = st.session_state.engine
+    discard_ai_event()
+    discard_ai_prefetch()
+    trace = current_trace()
+    with trace.span('auto_play'):
+        results = engine.auto_play()
+    get_game_store().record_rounds(st.session_state.game_id, engine.log.events[-len(results):])
+    trace.count('rounds_total', len(results))
+    st.session_state.auto_play_summary = [
+        {'ラウンド': result.round_number,
+         '対象': engine.players[result.target_index]['name'] if result.target_index is not None else "全員",
+         '内容': result.drink_display if result.message is None else result.message.replace("**", "")}
+        for result in results
+    ]
+    st.session_state.selected_player_index = None
+    st.session_state.selected_special = None
+    st.session_state.last_selected = None
+    st.session_state.last_special_effect = None
+    st.session_state.ai_event_description = None
+
+def finish_spin():
+    """回転を終了し結果表示に切り替える"""
+    st.session_state.spinning = False
+    st.session_state.spin_id = None
+    st.session_state.spin_started_at = None
+
+@st.fragment(run_every=1.0)
+def spin_timeout_watchdog():
+    """回転完了通知が届かない場合のサーバー側フォールバック"""
+    if not st.session_state.spinning:
+        return
     
-    col1, col2 = st.columns([3, 2])
+    started_at = st.session_state.spin_started_at or 0
+    if time.time() - started_at >= SPIN_TIMEOUT_SECONDS:
+        finish_spin()
+        st.rerun()
+
+@st.fragment(run_every=0.25)
+def ai_event_watcher():
+    """AIイベントの到着を監視し、生成途中の文を表示
+
+    届いたら（締め切りを過ぎたら）画面全体を1回だけ再実行する。再実行後の画面はこのフラグメントを
+    呼ばないので、定期実行もそこで止まる（分析パネルのキャッシュ・ブレーカー表示もこのとき更新される）。
+    """
+    if poll_ai_event():
+        st.rerun()
     
-    with col1:
-        st.subheader("📊 現在の酔い度")
+    stream = st.session_state.ai_event_stream
+    partial = stream.text if stream is not None else ""
+    if partial:
+        st.markdown("**🤖 AIマスターからの追加提案:**")
+        st.warning(partial + "▌")
+    else:
+        st.caption("🤖 AIマスターが考え中...")
+
+@st.fragment
+@timed_render('result')
+def result_banner():
+    """直前のラウンドの結果（AIイベントの到着はこの中の ai_event_watcher だけが更新する）"""
+    if st.session_state.last_special_effect:
+        st.markdown("---")
+        st.success("🎊 特別効果発動！")
+        st.info(st.session_state.last_special_effect)
         
-        sorted_players = sorted(st.session_state.players, key=lambda x: x['drunk_degree'], reverse=True)
+    elif st.session_state.last_selected:
+        st.markdown("---")
+        st.success(f"🎯 選ばれた人: **{st.session_state.last_selected}**")
+        st.info(f"🍶 飲む量: **{st.session_state.last_drink}**")
         
-        for i, p in enumerate(sorted_players, 1):
-            col_rank, col_name, col_progress, col_stats = st.columns([1, 2, 3, 2])
-            
-            with col_rank:
-                medals = ["", "🥇", "🥈", "🥉"]
-                medal = medals[i] if i <= 3 else f"{i}位"
-                st.write(medal)
-            
-            with col_name:
-                effects = st.session_state.special_effects_active.get(p['name'], {})
-                shield_icon = "🛡️" if effects.get('shield') else ""
-                st.write(f"**{shield_icon}{p['name']}**")
-            
-            with col_progress:
-                st.progress(p['drunk_degree'] / 100)
-            
-            with col_stats:
-                st.write(f"{p['drunk_degree']:.1f}%")
-                st.caption(f"{p['total_drunk']:.1f}杯")
+        # AIイベント表示
+        if st.session_state.ai_event_description:
+            st.markdown("**🤖 AIマスターからの追加提案:**")
+            st.warning(st.session_state.ai_event_description)
+        elif st.session_state.ai_event_future is not None:
+            ai_event_watcher()
+
+def hosted_room():
+    """このセッションがホストをしているルーム（無ければ None）"""
+    code = st.session_state.room_code
+    if code is None:
+        return None
+    room = get_room_store().get(code)
+    if room is None or room.closed or not room.is_host(st.session_state.room_host_token):
+        st.session_state.room_code = None
+        return None
+    return room
+
+def publish_room():
+    """ホストならゲームの状態をルームに公開（変化が無ければ観戦者は起こさない）"""
+    room = hosted_room()
+    if room is None:
+        return
+    engine = st.session_state.engine
+    game_state = st.session_state.game_state
+    if engine is None or game_state not in ('playing', 'finished'):
+        room.publish(RoomState(game_state='waiting'))
+        return
+    room.publish(RoomState.from_engine(
+        engine, game_state=game_state,
+        spinning=st.session_state.spinning and game_state == 'playing',
+        last_selected=st.session_state.last_selected,
+        last_drink=st.session_state.last_drink,
+        last_special_effect=st.session_state.last_special_effect,
+        ai_event_description=st.session_state.ai_event_description,
+    ))
+
+def display_room_controls():
+    """ホスト用：観戦ルームの作成・コード表示（サイドバー）"""
+    with st.sidebar:
+        st.subheader("📡 観戦ルーム")
+        room = hosted_room()
+        if room is None:
+            st.caption("大きな画面やスマホから同じゲームを見られます。")
+            if st.button("ルームを作成", use_container_width=True):
+                token = uuid.uuid4().hex
+                room = get_room_store().create(token, RoomState(game_state='waiting'))
+                st.session_state.room_code = room.code
+                st.session_state.room_host_token = token
+                st.rerun()
+            return
+        st.markdown(f"ルームコード: **{room.code}**")
+        st.caption(f"観戦中: {room.viewer_count()}人（URL に ?room={room.code} を付けても参加できます）")
+        if st.button("ルームを閉じる", use_container_width=True):
+            get_room_store().close(room.code, st.session_state.room_host_token)
+            st.session_state.room_code = None
+            st.rerun()
+
+def leave_spectating():
+    """観戦をやめてメニューへ（URL のルームコードも外す）"""
+    st.session_state.spectate_code = None
+    st.session_state.game_state = 'menu'
+    if 'room' in st.query_params:
+        del st.query_params['room']
+
+@st.fragment(run_every=1.0)
+def spectator_view():
+    """観戦画面。1秒ごとのフラグメントでルームの最新の状態を読んで描き直す
+
+    待ち受けはしないので、観戦者ごとにスレッドを止めておくことはない（画面への反映は最大で約1秒遅れる）。
+    """
+    room = get_room_store().get(st.session_state.spectate_code)
+    if room is None:
+        st.error("ルームが見つかりません（閉じられたか、コードが違います）。")
+        return
+    state = room.check(viewer=st.session_state.viewer_id)
     
-    with col2:
-        st.subheader("🤖 AI分析")
-        analysis = analyze_game_balance()
-        st.markdown(analysis)
-        
-        # AI機能の状態表示
-        if GEMINI_API_KEY and AI_AVAILABLE:
-            st.success("✅ AI機能: 有効")
-        else:
-            st.info("ℹ️ AI機能: 無効")
+    if state.game_state == 'closed':
+        st.info("ホストがルームを閉じました。")
+        return
+    if state.game_state == 'waiting':
+        st.info("⏳ ホストが次のゲームを準備中です...")
+        return
+    
+    if state.game_state == 'finished':
+        st.markdown(f"### 🎉 ゲーム終了（{state.round_count}ラウンド）")
+    else:
+        st.markdown(f"### 🎲 ラウンド {min(state.round_count + 1, state.max_rounds)}/{state.max_rounds}")
+    
+    if state.spinning:
+        st.info("🎯 バランサールーレット回転中...")
+    elif state.last_special_effect:
+        st.success("🎊 特別効果発動！")
+        st.info(state.last_special_effect)
+    elif state.last_selected:
+        st.success(f"🎯 選ばれた人: **{state.last_selected}**")
+        st.info(f"🍶 飲む量: **{state.last_drink}**")
+        if state.ai_event_description:
+            st.markdown("**🤖 AIマスターからの追加提案:**")
+            st.warning(state.ai_event_description)
+    
+    st.metric("バランススコア", f"{state.balance_score:.1f}/100")
+    medals = ["", "🥇", "🥈", "🥉"]
+    for i, p in enumerate(state.players, 1):
+        col_rank, col_name, col_progress, col_stats = st.columns([1, 2, 3, 2])
+        col_rank.write(medals[i] if i <= 3 else f"{i}位")
+        col_name.write(f"**{'🛡️' if p.shielded else ''}{p.name}**")
+        col_progress.progress(p.drunk_degree / 100)
+        col_stats.write(f"{p.drunk_degree:.1f}%（{p.total_drunk:.1f}杯）")
+
+def display_instrumentation(trace):
+    """計測結果をサイドバーに表示（?instrument=spans / profile のときだけ）"""
+    if not (st.query_params.get("instrument") or INSTRUMENTATION) or isinstance(trace, NullTrace):
+        return
+    with st.sidebar:
+        st.subheader("⏱️ 計測（この再実行）")
+        st.dataframe([{'区間': SPAN_LABELS.get(name, name), '回数': count, '合計': f"{total * 1000:.1f}ms"}
+                      for name, (count, total) in trace.totals().items()],
+                     use_container_width=True, hide_index=True)
+        top = trace.top_functions()
+        if top:
+            st.caption("cProfile（累積時間の上位）")
+            st.dataframe([{'関数': function, '呼び出し': calls, '自身': f"{own * 1000:.1f}ms",
+                           '累積': f"{cumulative * 1000:.1f}ms"}
+                          for function, calls, own, cumulative in top],
+                         use_container_width=True, hide_index=True)
+        if METRICS_FILE:
+            st.caption(f"メトリクスの書き出し先: {METRICS_FILE}")
+        if METRICS_PORT:
+            st.caption(f"メトリクス: http://127.0.0.1:{METRICS_PORT}/metrics")
+
+# 計測区間の表示名
+SPAN_LABELS = {
+    'selection': "プレイヤー選択",
+    'effect': "効果の適用（特別効果を含む）",
+    'ai_call': "AI提案の生成（裏のスレッド）",
+    'auto_play': "自動進行",
+    'roulette_render': "ルーレット描画",
+    'status_render': "ステータス描画",
+    'analysis_render': "AI分析の描画",
+    'result_render': "結果表示の描画",
+    'rerun': "再実行全体",
+}
 
 # メインアプリケーション
+trace = start_trace()
+page_started = time.perf_counter()
 st.title("🍶 バランサールーレット2.0")
 st.caption("AI強化版 - より公平で盛り上がる飲みゲーム！")
 
+# ?room=コード で開かれたら観戦画面へ
+if st.session_state.spectate_code is None and st.query_params.get('room'):
+    st.session_state.spectate_code = RoomStore.normalize_code(st.query_params['room'])
+    st.session_state.game_state = 'spectating'
+
+# ルーレットを表示しない画面では、次回表示時に盤面を送り直す
+if st.session_state.game_state != 'playing':
+    forget_layout()
+
 # メニュー画面
 if st.session_state.game_state == 'menu':
     st.markdown("---")
@@ -491,14 +733,15 @@ if st.session_state.game_state == 'menu':
         )
         
         if difficulty == "ソフト（ゆるめ）":
-            st.session_state.max_rounds = 12
+            st.session_state.difficulty = 'soft'
             st.info("🌸 ゆったりペース")
         elif difficulty == "ハード（激しめ）":
-            st.session_state.max_rounds = 20
+            st.session_state.difficulty = 'hard'
             st.warning("🔥 上級者向け")
         else:
-            st.session_state.max_rounds = 15
+            st.session_state.difficulty = 'normal'
             st.success("⚖️ バランス良好")
+        st.session_state.max_rounds = DIFFICULTY_ROUNDS[st.session_state.difficulty]
     
     st.markdown("---")
     
@@ -507,34 +750,57 @@ if st.session_state.game_state == 'menu':
     with col1:
         if st.button("🆕 新しいゲームを開始", use_container_width=True, type="primary"):
             st.session_state.game_state = 'input_players'
-            st.session_state.players = []
-            st.session_state.special_effects_active = {}
+            st.session_state.engine = None
             st.rerun()
     
     with col2:
+        # このセッションで遊んでいなければ、保存済みの最後の名簿を使う
+        if st.session_state.saved_players is None:
+            last_roster = get_game_store().last_roster()
+            if last_roster is not None:
+                st.session_state.roster_id = last_roster[0]
+                st.session_state.saved_players = PlayerRoster(last_roster[1])
+        
         if st.session_state.saved_players and st.button("👥 前回のプレイヤーで開始", use_container_width=True):
-            st.session_state.players = [p.copy() for p in st.session_state.saved_players]
-            for p in st.session_state.players:
-                p['drunk_degree'] = 0
-                p['total_drunk'] = 0
+            st.session_state.engine = new_engine(st.session_state.saved_players.snapshot(),
+                                                 roster_id=st.session_state.roster_id)
             st.session_state.game_state = 'playing'
-            st.session_state.round_count = 0
-            st.session_state.special_effects_active = {}
             st.rerun()
+    
+    if st.button("📊 履歴分析を見る", use_container_width=True):
+        st.session_state.game_state = 'history'
+        st.rerun()
+    
+    with st.expander("👀 ほかの端末のゲームを観戦する"):
+        code = st.text_input("ルームコード", key="spectate_input")
+        if st.button("観戦する", use_container_width=True, disabled=not code):
+            st.session_state.spectate_code = RoomStore.normalize_code(code)
+            st.session_state.game_state = 'spectating'
+            st.rerun()
+    
+    lifetime_stats = get_game_store().lifetime_stats()
+    if lifetime_stats:
+        with st.expander("📈 通算成績"):
+            st.dataframe(
+                [{'名前': row['name'], '参加': row['games'], '勝者': row['top_count'],
+                  '平均酔い度': f"{row['avg_drunk']:.1f}%", '総飲酒量': f"{row['total_drunk']:.1f}杯"}
+                 for row in lifetime_stats],
+                use_container_width=True, hide_index=True,
+            )
 
 # プレイヤー入力画面
 elif st.session_state.game_state == 'input_players':
     st.markdown("---")
     st.subheader("👥 参加者情報の入力")
     
-    num_players = st.number_input("参加人数（3〜12人）", min_value=3, max_value=12, value=5)
+    num_players = st.number_input(f"参加人数（3〜{MAX_PLAYERS}人）", min_value=3, max_value=MAX_PLAYERS, value=5)
     
     st.markdown("---")
     
     players_temp = []
     
     for i in range(num_players):
-        with st.expander(f"プレイヤー {i+1}", expanded=True):
+        with st.expander(f"プレイヤー {i+1}", expanded=num_players <= EXPANDED_INPUT_PLAYERS):
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
@@ -561,48 +827,45 @@ elif st.session_state.game_state == 'input_players':
     st.markdown("---")
     
     if st.button("✅ ゲーム開始", use_container_width=True, type="primary"):
-        st.session_state.players = players_temp
-        st.session_state.saved_players = [p.copy() for p in players_temp]
+        st.session_state.engine = new_engine(players_temp)
+        st.session_state.saved_players = st.session_state.engine.players.snapshot()
         st.session_state.game_state = 'playing'
-        st.session_state.round_count = 0
         st.session_state.selected_player_index = None
         st.session_state.selected_special = None
         st.session_state.spinning = False
-        st.session_state.special_effects_active = {}
         st.rerun()
 
 # ゲーム中
 elif st.session_state.game_state == 'playing':
-    st.markdown(f"### 🎲 ラウンド {st.session_state.round_count + 1}/{st.session_state.max_rounds}")
+    engine = st.session_state.engine
+    st.markdown(f"### 🎲 ラウンド {engine.round_count + 1}/{engine.max_rounds}")
+    st.caption(f"シード: {engine.seed}（同じシードと記録から結果を再現できます）")
+    
+    # 届いたAIイベントを回収（未着なら結果表示の中で到着を監視）
+    poll_ai_event()
+    if not engine.is_finished and not st.session_state.spinning:
+        prefetch_ai_events(engine)
     
-    if st.session_state.round_count < st.session_state.max_rounds:
-        # ルーレット表示
+    if not engine.is_finished:
+        # ルーレット表示（一度マウントしたコンポーネントを差分で更新）
+        with trace.span('roulette_render'):
+            completed_spin_id = roulette(engine.players,
+                                         selected_index=st.session_state.selected_player_index,
+                                         selected_special=st.session_state.selected_special,
+                                         spinning=st.session_state.spinning,
+                                         spin_id=st.session_state.spin_id,
+                                         shielded_names=engine.shielded_names(),
+                                         height=550,
+                                         key="roulette")
+        
         if st.session_state.spinning:
-            components.html(
-                create_enhanced_roulette_html(st.session_state.players, 
-                                            selected_index=st.session_state.selected_player_index,
-                                            selected_special=st.session_state.selected_special,
-                                            spinning=True), 
-                height=550, 
-                scrolling=False
-            )
-            
-            with st.spinner("🎯 バランサールーレット回転中..."):
-                time.sleep(4.2)
-            
-            st.session_state.spinning = False
-            st.rerun()
+            # クライアントから回転完了が届いたら結果表示へ
+            if completed_spin_id is not None and completed_spin_id == st.session_state.spin_id:
+                finish_spin()
+                st.rerun()
             
-        elif st.session_state.selected_player_index is not None or st.session_state.selected_special is not None:
-            components.html(
-                create_enhanced_roulette_html(st.session_state.players, 
-                                            selected_index=st.session_state.selected_player_index,
-                                            selected_special=st.session_state.selected_special), 
-                height=550, 
-                scrolling=False
-            )
-        else:
-            components.html(create_enhanced_roulette_html(st.session_state.players), height=550, scrolling=False)
+            st.info("🎯 バランサールーレット回転中...")
+            spin_timeout_watchdog()
         
         col1, col2 = st.columns([1, 2])
         
@@ -610,44 +873,41 @@ elif st.session_state.game_state == 'playing':
             if st.button("🎯 スマートルーレットを回す", use_container_width=True, type="primary", 
                         disabled=st.session_state.spinning):
                 
-                # スマート選択実行
-                selected_index, selected_special = smart_player_selection(st.session_state.players)
+                # スマート選択実行（特別効果・シールド処理を含む）
+                round_number = engine.round_count + 1
+                with trace.span('selection'):
+                    event = engine.decide(round_number, engine.round_seed(round_number))
+                with trace.span('effect'):
+                    result = engine.apply(event)
+                trace.count('rounds_total')
+                get_game_store().record_round(st.session_state.game_id, engine.log.events[-1])
                 
-                st.session_state.selected_player_index = selected_index
-                st.session_state.selected_special = selected_special
+                st.session_state.selected_player_index = result.selected_index
+                st.session_state.selected_special = result.special
+                discard_ai_event()
                 
-                if selected_special:
-                    # 特別効果の処理
-                    effect_msg = process_special_effect(selected_special, st.session_state.players)
-                    st.session_state.last_special_effect = effect_msg
+                if result.special:
+                    st.session_state.last_special_effect = result.message
                     
-                elif selected_index is not None:
-                    # 通常のプレイヤー選択
-                    selected_player = st.session_state.players[selected_index]
+                else:
+                    selected_player = engine.players[result.selected_index]
+                    st.session_state.last_selected = selected_player['name']
+                    st.session_state.last_drink = result.drink_display
                     
-                    # シールド効果の確認
-                    if st.session_state.special_effects_active.get(selected_player['name'], {}).get('shield', False):
-                        st.session_state.last_selected = selected_player['name']
-                        st.session_state.last_drink = "シールドで無効化！"
-                        # シールド消費
-                        st.session_state.special_effects_active[selected_player['name']]['shield'] = False
-                    else:
-                        multiplier = calculate_drink_amount(selected_player)
-                        drink_display = get_drink_display(multiplier, selected_player['cup_type'])
-                        
-                        st.session_state.last_selected = selected_player['name']
-                        st.session_state.last_drink = drink_display
-                        
-                        update_drunk_degree(selected_player, multiplier)
-                        
-                        # AI追加イベント生成
-                        ai_event = generate_ai_event(selected_player, st.session_state.players)
-                        if ai_event:
-                            st.session_state.ai_event_description = ai_event
+                    if not result.shield_consumed:
+                        # AI追加イベント生成（結果を待たずに回転開始）
+                        generate_ai_event(selected_player, engine.players)
                 
-                st.session_state.round_count += 1
                 st.session_state.spinning = True
+                st.session_state.spin_id = uuid.uuid4().hex
+                st.session_state.spin_started_at = time.time()
                 st.rerun()
+            
+            if not st.session_state.spinning:
+                remaining = engine.max_rounds - engine.round_count
+                if st.button(f"⏩ 残り{remaining}ラウンドを自動で進める", use_container_width=True):
+                    auto_play_rest()
+                    st.rerun()
         
         with col2:
             if (st.session_state.selected_player_index is not None or st.session_state.selected_special is not None) and not st.session_state.spinning:
@@ -657,46 +917,75 @@ elif st.session_state.game_state == 'playing':
                     st.session_state.last_selected = None
                     st.session_state.last_special_effect = None
                     st.session_state.ai_event_description = None
+                    discard_ai_event()
+                    st.rerun()
+            
+            if engine.log.events and not st.session_state.spinning:
+                if st.button("↩️ 直前のラウンドを取り消す", use_container_width=True):
+                    undo_round()
                     st.rerun()
         
         # 結果表示
         if not st.session_state.spinning:
-            if st.session_state.last_special_effect:
-                st.markdown("---")
-                st.success("🎊 特別効果発動！")
-                st.info(st.session_state.last_special_effect)
-                
-            elif st.session_state.last_selected:
-                st.markdown("---")
-                st.success(f"🎯 選ばれた人: **{st.session_state.last_selected}**")
-                st.info(f"🍶 飲む量: **{st.session_state.last_drink}**")
-                
-                # AIイベント表示
-                if st.session_state.ai_event_description:
-                    st.markdown("**🤖 AIマスターからの追加提案:**")
-                    st.warning(st.session_state.ai_event_description)
+            result_banner()
         
         # 強化されたステータス表示
         if not st.session_state.spinning:
-            display_enhanced_status()
+            display_enhanced_status(engine)
     
     else:
+        get_game_store().finish_game(st.session_state.game_id, engine.players.ranking())
+        get_history().append_game(st.session_state.game_id, engine)
         st.session_state.game_state = 'finished'
         st.rerun()
 
+# 観戦画面
+elif st.session_state.game_state == 'spectating':
+    st.markdown("---")
+    st.subheader(f"👀 観戦中（ルーム {st.session_state.spectate_code}）")
+    if st.button("🚪 観戦をやめる"):
+        leave_spectating()
+        st.rerun()
+    spectator_view()
+
+# 履歴分析画面
+elif st.session_state.game_state == 'history':
+    st.markdown("---")
+    st.subheader("📊 履歴分析")
+    if st.button("🏠 メニューに戻る"):
+        st.session_state.game_state = 'menu'
+        st.rerun()
+    display_history_analytics()
+
 # ゲーム終了画面
 elif st.session_state.game_state == 'finished':
     st.markdown("---")
     st.markdown("# 🎉 バランサールーレット2.0 ゲーム終了！")
     st.markdown("---")
     
+    engine = st.session_state.engine
+    
     # 最終分析
-    final_analysis = analyze_game_balance()
+    final_analysis = analyze_game_balance(engine.players, engine.round_count, engine.expected_shares)
     st.markdown(final_analysis)
     
+    # バランスの推移（ラウンドごとに記録済みの値をそのまま描く）
+    if engine.balance_timeline:
+        st.markdown("### 📉 バランスの推移")
+        st.line_chart({
+            'ラウンド': list(range(1, len(engine.balance_timeline) + 1)),
+            'バランススコア': [stats['balance_score'] for stats in engine.balance_timeline],
+            '公平度（100 - ジニ係数×100）': [100 * (1 - stats['gini']) for stats in engine.balance_timeline],
+        }, x='ラウンド')
+    
+    if st.session_state.auto_play_summary:
+        with st.expander(f"⏩ 自動で進めたラウンド（{len(st.session_state.auto_play_summary)}件）"):
+            st.dataframe(st.session_state.auto_play_summary, use_container_width=True, hide_index=True)
+    
     st.markdown("### 🏆 最終ランキング")
     
-    sorted_players = sorted(st.session_state.players, key=lambda x: x['drunk_degree'], reverse=True)
+    sorted_players = engine.players.ranking()
+    final_gaps = engine.share_gaps()
     
     for i, p in enumerate(sorted_players, 1):
         with st.container():
@@ -716,6 +1005,7 @@ elif st.session_state.game_state == 'finished':
             with col4:
                 st.write(f"酔い度: {p['drunk_degree']:.1f}%")
                 st.write(f"飲んだ量: {p['total_drunk']:.1f}杯分")
+                st.caption(f"期待の取り分との差: {final_gaps[p.index]:+.1f}pt")
     
     st.markdown("---")
     
@@ -724,12 +1014,12 @@ elif st.session_state.game_state == 'finished':
     st.success(f"🏆 **{winner['name']}**さんが勝者です！")
     st.info(f"**{winner['name']}**さんは他の人に1杯飲ませることができます！")
     
-    other_players = [p['name'] for p in st.session_state.players if p['name'] != winner['name']]
+    other_players = [p['name'] for p in engine.players if p['name'] != winner['name']]
     if other_players:
         victim_name = st.selectbox("誰に飲ませますか？", other_players)
         
         if st.button("👑 特権発動！", use_container_width=True):
-            for p in st.session_state.players:
+            for p in engine.players:
                 if p['name'] == victim_name:
                     multiplier = calculate_drink_amount(p)
                     drink_display = get_drink_display(multiplier, p['cup_type'])
@@ -739,22 +1029,41 @@ elif st.session_state.game_state == 'finished':
     
     st.markdown("---")
     
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("🔄 もう1回遊ぶ", use_container_width=True):
-            for p in st.session_state.players:
-                p['drunk_degree'] = 0
-                p['total_drunk'] = 0
+            engine.reset()
+            start_recording(engine)
+            discard_ai_prefetch()
             st.session_state.game_state = 'playing'
-            st.session_state.round_count = 0
             st.session_state.selected_player_index = None
             st.session_state.selected_special = None
             st.session_state.spinning = False
-            st.session_state.special_effects_active = {}
             st.rerun()
     
     with col2:
+        if st.button("↩️ 最後のラウンドを取り消す", use_container_width=True):
+            undo_round()
+            st.rerun()
+    
+    with col3:
         if st.button("🏠 メニューに戻る", use_container_width=True):
             st.session_state.game_state = 'menu'
             st.rerun()
+
+# ホストなら観戦ルームの操作を出し、この実行で変わった状態を公開
+if st.session_state.game_state in ('playing', 'finished'):
+    display_room_controls()
+publish_room()
+
+# st.rerun() で打ち切られた実行は記録しない
+record_render_time('page', time.perf_counter() - page_started)
+trace.finish()
+display_instrumentation(trace)
+if METRICS_FILE:
+    get_metrics().export_file(METRICS_FILE)
+
+# 初回描画が終わってから Gemini SDK をバックグラウンドで読み込んでおく
+if GEMINI_API_KEY and AI_FAKE_MODEL_DELAY is None:
+    get_gemini_loader().warm_up()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from game_engine import GameEngine
+from game_store import GameStore
+
+def fill(store, num_games, num_players, pool_size, rounds, seed):
+    """過去のゲームを num_games 件作る（1ラウンドごとに保存する本番と同じ書き込み方）"""
+    rng = random.Random(seed)
+    pool = [f"プレイヤー{i + 1}" for i in range(pool_size)]
+    started = time.perf_counter()
+    for g in range(num_games):
+        players = [{'name': name, 'strength': rng.randint(1, 5), 'preference': rng.randint(1, 5),
+                    'cup_type': 'おちょこ'} for name in rng.sample(pool, num_players)]
+        roster_id = store.save_roster(players, created_at=g)
+        engine = GameEngine(players, max_rounds=rounds, seed=rng.getrandbits(32))
+        game_id = store.start_game(roster_id, engine.seed, engine.max_rounds, started_at=g)
+        while not engine.is_finished:
+            engine.step()
+            store.record_round(game_id, engine.log.events[-1])
+        store.finish_game(game_id, engine.players.ranking(), finished_at=g)
+    elapsed = time.perf_counter() - started
+    return elapsed / (num_games * rounds), pool
+
+def timed(func, *args, repeat=50):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - started) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description="対戦履歴（SQLite）の書き込み・読み込みのベンチマーク")
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--pool", type=int, default=300, help="登場するプレイヤー名の種類")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = GameStore(os.path.join(tmp, "bench.sqlite3"))
+        per_round, pool = fill(store, args.games, args.players, args.pool, args.rounds, args.seed)
+        print(f"{args.games:,}ゲーム保存済み（1ラウンドの書き込み {per_round * 1e6:.0f}us）")
+        results = [
+            ("前回の名簿", timed(store.last_roster)),
+            ("1人の通算成績", timed(store.player_stats, pool[0])),
+            ("通算成績（全期間）", timed(store.lifetime_stats)),
+            ("通算成績（直近1割）", timed(store.lifetime_stats, args.games * 0.9)),
+            ("ゲームの記録読み込み", timed(store.load_rounds, args.games // 2)),
+        ]
+        for label, seconds in results:
+            print(f"{label:<16} {seconds * 1000:>8.2f}ms")
+        store.close()
+
+if __name__ == "__main__":
+    main()
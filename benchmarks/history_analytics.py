@@ -0,0 +1,94 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from game_engine import SPECIAL_PROBABILITY, SPECIAL_TYPES
+from history_columns import ColumnarHistory, downsample
+
+def synthetic_history(history, num_games, num_players, pool_size, rounds, seed, chunk_games=20000):
+    """何年分もの履歴を想定した合成データを追記（1日数ゲームを想定して時刻を振る）"""
+    rng = np.random.default_rng(seed)
+    names = [f"プレイヤー{i + 1}" for i in range(pool_size)]
+    first = True
+    for start in range(0, num_games, chunk_games):
+        games = min(chunk_games, num_games - start)
+        per_game = rounds * num_players
+        game = np.repeat(np.arange(start, start + games, dtype=np.int32), per_game)
+        rnd = np.tile(np.repeat(np.arange(1, rounds + 1, dtype=np.int16), num_players), games)
+        members = np.argsort(rng.random((games, pool_size)), axis=1)[:, :num_players].astype(np.int32)
+        player = np.repeat(members, rounds, axis=0).ravel()
+        selected_slot = rng.integers(0, num_players, size=games * rounds)
+        special = np.where(rng.random(games * rounds) < SPECIAL_PROBABILITY,
+                           rng.integers(1, len(SPECIAL_TYPES) + 1, size=games * rounds), 0).astype(np.int8)
+        selected = np.zeros((games * rounds, num_players), dtype=np.int8)
+        normal = special == 0
+        selected[np.flatnonzero(normal), selected_slot[normal]] = 1
+        amount = selected * rng.choice([0.5, 0.75, 1.0, 1.5, 2.0], size=selected.shape)
+        drunk = np.minimum(np.cumsum(amount.reshape(games, rounds, num_players), axis=1) * 10, 100)
+        rows = {
+            'game': game,
+            'round': rnd,
+            'player': player,
+            'drunk': drunk.ravel().astype(np.float32),
+            'amount': amount.ravel().astype(np.float32),
+            'selected': selected.ravel(),
+            'probability': np.full(game.shape, (1 - SPECIAL_PROBABILITY) / num_players, dtype=np.float32),
+            'special': np.repeat(special, num_players),
+            'batch': game - start,
+        }
+        batch_games = np.arange(start, start + games, dtype=np.int32)
+        batch_times = 1.6e9 + batch_games * 3600.0 * 6
+        history.append_columns(rows, batch_games, batch_times, player_names=names if first else ())
+        first = False
+
+def main():
+    parser = argparse.ArgumentParser(description="列形式の履歴分析（集計・グラフの間引き）のベンチマーク")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--pool", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--max-points", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = ColumnarHistory(tmp)
+        started = time.perf_counter()
+        synthetic_history(history, args.games, args.players, args.pool, args.rounds, args.seed)
+        print(f"{args.games:,}ゲーム（約{args.games / 4 / 365:.1f}年分）を生成: {time.perf_counter() - started:.1f}s")
+
+        timings = []
+        started = time.perf_counter()
+        frame = ColumnarHistory(tmp).load()
+        timings.append(("読み込み（メモリマップ）", time.perf_counter() - started))
+        for label, func in [("ラウンド別バランス", frame.balance_by_round_number),
+                            ("最終バランスの推移", frame.final_balance),
+                            ("選択回数と期待値", frame.selection_vs_model),
+                            ("特別セクション発生率", frame.special_frequency)]:
+            started = time.perf_counter()
+            func()
+            timings.append((label, time.perf_counter() - started))
+        times, scores = frame.final_balance()
+        started = time.perf_counter()
+        points = downsample(times, scores, args.max_points)
+        timings.append((f"間引き（{len(times):,}→{len(points[0]):,}点）", time.perf_counter() - started))
+
+        try:
+            import plotly.graph_objects as go
+        except ImportError:
+            go = None
+        if go is not None:
+            started = time.perf_counter()
+            figure = go.Figure(go.Scatter(x=points[0].astype('datetime64[s]'), y=points[1]))
+            figure.to_json()
+            timings.append(("Plotly 図の生成・シリアライズ", time.perf_counter() - started))
+
+        print(f"{len(frame):,}行")
+        for label, seconds in timings:
+            print(f"{label:<28} {seconds * 1000:>8.1f}ms")
+        print(f"{'合計':<28} {sum(s for _, s in timings) * 1000:>8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+# Gemini の代わりに遅延つきの偽バックエンドを使い、外部には出ない
+LOCAL_SECRETS = {
+    'AI_FAKE_MODEL_DELAY': 0.05,
+    'AI_FAKE_CHUNK_DELAY': 0.0,
+}
+
+def share_test_runtime(secrets):
+    """AppTest を複数スレッドで同時に動かせるようにする
+
+    AppTest は1回の実行ごとにプロセス全体の Runtime・secrets・設定を差し替えて最後に戻すので、
+    そのままでは同時に動かした別セッションの実行中に Runtime が消える。
+    ここで共有の Runtime を用意し、secrets と設定も最初に1回だけ入れておく
+    （各 AppTest には secrets を渡さない）。スクリプトのコンパイル結果も本番のサーバーと同じく
+    全セッションで共有する（実行ごとのコンパイルを複数スレッドで同時に行うと CPython 3.11 で失敗する）。
+    """
+    from unittest.mock import MagicMock
+
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    shared.dataframe_source_mgr = DataframeSourceManager()
+    shared.bidi_component_registry = BidiComponentManager()
+    shared.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    Runtime.instance = classmethod(lambda cls: cls._instance if cls._instance is not None else shared)
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    config.set_option("global.appTest", True)
+    st.secrets._secrets = dict(secrets)
+
+def click(at, prefix):
+    """ラベルが prefix で始まるボタンを押して再実行し、その再実行の時間を返す"""
+    button = next(b for b in at.button if b.label.startswith(prefix))
+    started = time.perf_counter()
+    button.click().run()
+    return time.perf_counter() - started
+
+def rerun(at):
+    started = time.perf_counter()
+    at.run()
+    return time.perf_counter() - started
+
+def play_session(players, timings):
+    """1セッションで menu → input_players → playing → finished まで進める"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=120)
+    timings.append(rerun(at))
+    timings.append(click(at, "🆕"))
+    at.number_input[0].set_value(players)
+    timings.append(rerun(at))
+    timings.append(click(at, "✅"))
+    while at.session_state.game_state == 'playing':
+        timings.append(click(at, "🎯"))
+        # ルーレットの演出は待たず、回転完了の通知が届かなかった場合と同じ経路で結果表示へ
+        while at.session_state.spinning and at.session_state.game_state == 'playing':
+            at.session_state.spin_started_at = 0
+            timings.append(rerun(at))
+        if at.session_state.game_state == 'playing':
+            timings.append(click(at, "➡️"))
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    if at.session_state.game_state != 'finished':
+        raise RuntimeError(f"終了画面に到達しませんでした: {at.session_state.game_state}")
+
+def run_level(sessions, games, players):
+    """同じプロセスで sessions 個のセッションを同時に動かす（キャッシュ・共有資源は本番と同じく共有）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        secrets = dict(LOCAL_SECRETS, GAME_DB_PATH=os.path.join(tmp, "load.sqlite3"),
+                       HISTORY_DIR=os.path.join(tmp, "history"))
+        share_test_runtime(secrets)
+        # 1回目の import と cache_resource の初期化は計測から外す
+        play_session(players, [])
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        timings = [[] for _ in range(sessions)]
+        errors = []
+
+        def worker(n):
+            try:
+                for _ in range(games):
+                    play_session(players, timings[n])
+            except Exception as error:
+                errors.append(repr(error))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(sessions)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    samples = np.concatenate([np.asarray(t) for t in timings]) * 1000
+    return {
+        'sessions': sessions,
+        'reruns': int(len(samples)),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'reruns_per_second': len(samples) / elapsed,
+        'games_per_minute': sessions * games / elapsed * 60,
+        # Linux の ru_maxrss は KB。最初の1ゲーム後からの増加分をセッション数で割る
+        'peak_mb_per_session': max(0, peak_kb - baseline_kb) / 1024 / sessions,
+        'peak_mb': peak_kb / 1024,
+        'errors': errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="AppTest で複数セッションを同時に動かす負荷試験")
+    parser.add_argument("--sessions", default="1,2,4,8", help="同時セッション数（カンマ区切り）")
+    parser.add_argument("--games", type=int, default=2, help="1セッションあたりのゲーム数")
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_level(args.worker, args.games, args.players)))
+        return
+
+    # メモリの最大値を正しく測るため、同時セッション数ごとに新しいプロセスで動かす
+    results = []
+    for sessions in (int(value) for value in args.sessions.split(",")):
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.load_test", "--worker", str(sessions),
+             "--games", str(args.games), "--players", str(args.players)],
+            cwd=ROOT, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "失敗しました")
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'同時':>4} {'再実行':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'再実行/秒':>9} {'ゲーム/分':>9} "
+          f"{'MB/セッション':>12}")
+    for row in results:
+        print(f"{row['sessions']:>4} {row['reruns']:>6} {row['p50_ms']:>6.1f}ms {row['p95_ms']:>6.1f}ms "
+              f"{row['p99_ms']:>6.1f}ms {row['reruns_per_second']:>9.1f} {row['games_per_minute']:>9.1f} "
+              f"{row['peak_mb_per_session']:>12.1f}")
+        for error in row['errors']:
+            print(f"  エラー: {error}")
+
+if __name__ == "__main__":
+    main()
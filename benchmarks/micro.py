@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+
+from game_engine import (GameEngine, analyze_game_balance, calculate_drink_amount, calculate_player_weight,
+                         smart_player_selection)
+from round_log import RoundEvent
+from roulette_render import (_css_wheel_markup, _svg_wheel_markup, _wheel_document_prefix,
+                             create_enhanced_roulette_html)
+
+# 既定の基準値ファイル（マシンごとに --save で作り直す）
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+
+PLAYER_COUNTS = (3, 12, 100, 1000)
+
+# 基準値よりこの倍率を超えて遅くなったら失敗にする
+DEFAULT_THRESHOLD = 1.3
+# 数 us 以下の処理は計測の揺れで倍率が大きく振れるので、差がこれ未満なら遅くなったとみなさない
+MIN_REGRESSION_SECONDS = 1e-6
+
+def make_players(num_players, seed=0):
+    rng = random.Random(seed)
+    return [{'name': f"プレイヤー{i + 1}", 'strength': rng.randint(1, 5), 'preference': rng.randint(1, 5),
+             'cup_type': 'おちょこ', 'drunk_degree': rng.uniform(0, 80), 'total_drunk': rng.uniform(0, 8)}
+            for i in range(num_players)]
+
+def make_engine(num_players):
+    engine = GameEngine(make_players(num_players), seed=0)
+    for _ in range(min(10, engine.max_rounds)):
+        engine.step()
+    return engine
+
+def clear_render_caches():
+    _css_wheel_markup.cache_clear()
+    _svg_wheel_markup.cache_clear()
+    _wheel_document_prefix.cache_clear()
+
+# 計測対象：名前 → 人数を受け取り、1回分の処理を行う関数を返す
+def case_drink_amount(num_players):
+    players = make_players(num_players)
+    return lambda: [calculate_drink_amount(p) for p in players]
+
+def case_player_weight(num_players):
+    players = make_players(num_players)
+    return lambda: [calculate_player_weight(p) for p in players]
+
+def case_selection(num_players):
+    engine = make_engine(num_players)
+    rng = random.Random(0)
+    return lambda: smart_player_selection(engine.players, rng, engine.params, engine.sampler)
+
+def case_selection_without_sampler(num_players):
+    engine = make_engine(num_players)
+    rng = random.Random(0)
+    return lambda: smart_player_selection(engine.players, rng, engine.params)
+
+def case_special_effect(special):
+    # process_special_effect は GameEngine._apply（記録1件分の適用）に置き換わっている
+    def case(num_players):
+        engine = make_engine(num_players)
+        event = RoundEvent(round_number=engine.round_count, seed=0, special=special, target_index=0,
+                           multiplier=0.5 if special == 'everyone' else 2.0)
+        return lambda: engine._apply(event)
+    return case
+
+def case_balance_analysis(num_players):
+    engine = make_engine(num_players)
+    return lambda: analyze_game_balance(engine.players, engine.round_count, engine.expected_shares)
+
+def case_auto_play(num_players):
+    engine = GameEngine(make_players(num_players), max_rounds=20, seed=0)
+
+    def play():
+        engine.reset(seed=0)
+        engine.auto_play()
+    return play
+
+def case_roulette_html(cold):
+    def case(num_players):
+        players = make_players(num_players)
+        shielded = frozenset({players[0]['name']})
+
+        def render():
+            if cold:
+                clear_render_caches()
+            create_enhanced_roulette_html(players, selected_index=1, spinning=True, spin_id="0",
+                                          shielded_names=shielded)
+        return render
+    return case
+
+CASES = {
+    'calculate_drink_amount': case_drink_amount,
+    'calculate_player_weight': case_player_weight,
+    'smart_player_selection': case_selection,
+    'smart_player_selection[重みリスト]': case_selection_without_sampler,
+    'process_special_effect[double]': case_special_effect('double'),
+    'process_special_effect[everyone]': case_special_effect('everyone'),
+    'analyze_game_balance': case_balance_analysis,
+    'GameEngine.auto_play[20ラウンド]': case_auto_play,
+    'create_enhanced_roulette_html': case_roulette_html(cold=False),
+    'create_enhanced_roulette_html[キャッシュなし]': case_roulette_html(cold=True),
+}
+
+def measure(func, repeat, min_seconds):
+    """1回あたりの時間（秒）。min_seconds 以上かかる回数でまとめて測り、repeat 回のうち最小を取る"""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_seconds:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def run(names, player_counts, repeat, min_seconds):
+    results = {}
+    for name in names:
+        for num_players in player_counts:
+            key = f"{name}/{num_players}"
+            results[key] = measure(CASES[name](num_players), repeat, min_seconds)
+            print(f"  {key:<52} {results[key] * 1e6:>12.2f}us", file=sys.stderr)
+    return results
+
+def machine_info():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'node': platform.node()}
+
+def compare(results, baseline, threshold):
+    """基準値と比べた (名前, 今回, 基準値, 倍率) と、threshold を超えて遅くなったものの一覧"""
+    rows = []
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        rows.append((key, seconds, base, seconds / base if base else None))
+    regressions = [row for row in rows
+                   if row[3] is not None and row[3] > threshold and row[1] - row[2] >= MIN_REGRESSION_SECONDS]
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="ルール・描画関数のマイクロベンチマーク（基準値との比較つき）")
+    parser.add_argument("--players", type=int, nargs="+", default=list(PLAYER_COUNTS))
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), help="測る関数を絞る")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="1回の計測に使う最短時間")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="今回の結果を基準値として保存")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="基準値の何倍より遅ければ失敗にするか")
+    args = parser.parse_args()
+
+    results = run(args.only or list(CASES), args.players, args.repeat, args.min_seconds)
+
+    if args.save:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                saved = json.load(f).get('results', {})
+        saved.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({'machine': machine_info(), 'results': saved}, f, ensure_ascii=False, indent=2,
+                      sort_keys=True)
+        print(f"基準値を保存しました: {args.baseline}（{len(results)}件）")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"基準値がありません。--save で作成してください: {args.baseline}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get('machine') != machine_info():
+        print(f"⚠️ 基準値は別の環境で取ったものです: {baseline.get('machine')}")
+    rows, regressions = compare(results, baseline.get('results', {}), args.threshold)
+
+    print(f"{'関数/人数':<52} {'今回':>12} {'基準値':>12} {'倍率':>7}")
+    for key, seconds, base, ratio in rows:
+        base_text = f"{base * 1e6:>10.2f}us" if base else f"{'-':>12}"
+        ratio_text = f"{ratio:>6.2f}x" if ratio else f"{'-':>7}"
+        mark = " ← 遅くなっています" if (key, seconds, base, ratio) in regressions else ""
+        print(f"{key:<52} {seconds * 1e6:>10.2f}us {base_text} {ratio_text}{mark}")
+
+    if regressions:
+        print(f"\n{len(regressions)}件が基準値の {args.threshold:.2f} 倍より遅くなりました。")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import argparse
+import threading
+import time
+
+from rooms import RoomState, RoomStore
+
+def run(store, codes, threads, operations):
+    """各スレッドがルームの取得と状態の公開を繰り返す。1操作あたりの時間を返す"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        barrier.wait()
+        for i in range(operations):
+            room = store.get(codes[(offset + i) % len(codes)])
+            room.publish(RoomState(round_count=i))
+
+    workers = [threading.Thread(target=worker, args=(n * 7,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - started) / (threads * operations)
+
+def viewer_check_cost(store, codes, viewers, ticks=20):
+    """観戦者 viewers 人が1秒ごとに状態を確認するときの、1回あたりの時間（秒）
+
+    確認は待ち受けないので、観戦者の数だけスレッドが止まったままになることはない。
+    """
+    started = time.perf_counter()
+    for tick in range(ticks):
+        for viewer in range(viewers):
+            store.get(codes[viewer % len(codes)]).check(viewer=viewer)
+    return (time.perf_counter() - started) / (ticks * viewers)
+
+def main():
+    parser = argparse.ArgumentParser(description="観戦ルームの一覧（区画ごとのロック）のベンチマーク")
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--operations", type=int, default=20000)
+    args = parser.parse_args()
+
+    for shards in (1, 64):
+        store = RoomStore(shards=shards)
+        codes = [store.create(f"host{i}", RoomState()).code for i in range(args.rooms)]
+        per_op = run(store, codes, args.threads, args.operations)
+        print(f"区画 {shards:>3}: 取得＋公開 {per_op * 1e6:.2f}us/回（{args.threads}スレッド、{args.rooms}ルーム）")
+    viewers = args.rooms * 4
+    per_check = viewer_check_cost(store, codes, viewers)
+    print(f"観戦者 {viewers}人の状態確認: {per_check * 1e6:.2f}us/回"
+          f"（1秒ごとなら CPU {per_check * viewers * 100:.2f}%）")
+
+if __name__ == "__main__":
+    main()
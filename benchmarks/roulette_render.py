@@ -0,0 +1,66 @@
+import argparse
+import json
+import time
+
+from roulette_render import (RENDERERS, _css_wheel_markup, _svg_wheel_markup, _wheel_document_prefix,
+                             calculate_target_rotation, create_enhanced_roulette_html, render_cache_info,
+                             section_index, wheel_layout)
+
+def make_players(num_players):
+    return [{'name': f"プレイヤー{i+1}"} for i in range(num_players)]
+
+def measure(players, repeat, cold, renderer):
+    """1回あたりの生成時間（秒）と送信バイト数"""
+    shielded = frozenset({players[0]['name']})
+    size = 0
+    started = time.perf_counter()
+    for i in range(repeat):
+        if cold:
+            # 変更前相当：毎回ドキュメント全体を組み立てる
+            _css_wheel_markup.cache_clear()
+            _svg_wheel_markup.cache_clear()
+            _wheel_document_prefix.cache_clear()
+        html = create_enhanced_roulette_html(players, selected_index=i % len(players),
+                                             spinning=True, spin_id=str(i), shielded_names=shielded,
+                                             renderer=renderer)
+        size = len(html.encode("utf-8"))
+    return (time.perf_counter() - started) / repeat, size
+
+def component_payload_bytes(players, renderer):
+    """ルーレットコンポーネントへ送る引数のサイズ（初回の盤面込み、以降の差分）"""
+    names = tuple(p['name'] for p in players)
+    layout = wheel_layout(names, renderer)
+    delta = {
+        'layout_key': layout['key'],
+        'layout': None,
+        'rotation': calculate_target_rotation(len(names), selected_index=1),
+        'spinning': True,
+        'spin_id': "0123456789abcdef0123456789abcdef",
+        'shielded': [0],
+        'highlight': section_index(len(names), selected_index=1),
+        'height': 550,
+    }
+    first = dict(delta, layout=layout)
+    size = lambda args: len(json.dumps(args, ensure_ascii=False).encode("utf-8"))
+    return size(first), size(delta)
+
+def main():
+    parser = argparse.ArgumentParser(description="ルーレットHTML生成のベンチマーク")
+    parser.add_argument("--players", type=int, nargs="+", default=[5, 12, 50, 200])
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--renderer", choices=RENDERERS, default='auto')
+    args = parser.parse_args()
+
+    print(f"{'人数':>6} {'キャッシュなし':>14} {'キャッシュあり':>14} {'高速化':>8} {'HTML送信バイト/回':>16}"
+          f" {'コンポーネント初回':>16} {'コンポーネント差分/回':>18}")
+    for num_players in args.players:
+        players = make_players(num_players)
+        cold, size = measure(players, args.repeat, cold=True, renderer=args.renderer)
+        warm, _ = measure(players, args.repeat, cold=False, renderer=args.renderer)
+        first, delta = component_payload_bytes(players, args.renderer)
+        print(f"{num_players:>6} {cold * 1e6:>12.1f}us {warm * 1e6:>12.1f}us {cold / warm:>7.1f}x {size:>16,}"
+              f" {first:>16,} {delta:>18,}")
+    print(render_cache_info())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 新しいプロセスで import にかかる時間を測るモジュール
+MODULES = ["streamlit", "numpy", "game_engine", "ai_events", "roulette_component", "google.generativeai"]
+
+_IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+# AppTest で app.py を1回描画するまで（プロセス起動直後から）の時間
+_FIRST_RENDER_SNIPPET = """
+import sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+harness = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=60)
+for key, value in {secrets!r}.items():
+    at.secrets[key] = value
+at.run()
+finished = time.perf_counter()
+assert not at.exception, at.exception
+print(harness - started, finished - harness, "google.generativeai" in sys.modules)
+"""
+
+def run_python(code):
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "失敗しました")
+    return result.stdout.strip().splitlines()[-1].split()
+
+def measure_import(module, repeat):
+    """モジュールの import 時間（秒、中央値）。入っていなければ None"""
+    samples = []
+    for _ in range(repeat):
+        try:
+            samples.append(float(run_python(_IMPORT_SNIPPET.format(root=ROOT, module=module))[0]))
+        except RuntimeError:
+            return None
+    return statistics.median(samples)
+
+def measure_first_render(repeat, secrets):
+    """初回描画までの時間（秒、中央値）と、描画直後に Gemini SDK の読み込みが始まっていたか"""
+    app = os.path.join(ROOT, "app.py")
+    samples = []
+    genai_loaded = False
+    for _ in range(repeat):
+        harness, render, loaded = run_python(_FIRST_RENDER_SNIPPET.format(app=app, secrets=secrets))
+        samples.append(float(render))
+        genai_loaded = genai_loaded or loaded == "True"
+    return statistics.median(samples), genai_loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間（import・初回描画）のベンチマーク")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--api-key", help="GEMINI_API_KEY を設定した状態でも測る（SDK は描画後に先読みされる）")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力")
+    args = parser.parse_args()
+
+    imports = {module: measure_import(module, args.repeat) for module in MODULES}
+    renders = {"APIキーなし": measure_first_render(args.repeat, {})}
+    if args.api_key:
+        renders["APIキーあり"] = measure_first_render(args.repeat, {"GEMINI_API_KEY": args.api_key})
+
+    if args.json:
+        print(json.dumps({
+            'import_seconds': imports,
+            'first_render_seconds': {name: seconds for name, (seconds, _) in renders.items()},
+            'genai_import_started_after_render': {name: loaded for name, (_, loaded) in renders.items()},
+        }, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'モジュール':<24} {'import時間':>10}")
+    for module, seconds in imports.items():
+        value = "未インストール" if seconds is None else f"{seconds * 1000:.0f}ms"
+        print(f"{module:<24} {value:>10}")
+    print()
+    print(f"{'条件':<12} {'初回描画':>10} {'描画直後のSDK読み込み':>20}")
+    for name, (seconds, loaded) in renders.items():
+        print(f"{name:<12} {seconds * 1000:>8.0f}ms {'あり' if loaded else 'なし':>20}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+import json
+import os
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from roster import PlayerRoster
+from round_log import EngineSnapshot, RoundEvent, RoundLog
+from weighted_sampler import FenwickSampler
+
+# 特別セクションの種類（ルーレット上の並び順）
+SPECIAL_TYPES = ['shield', 'double', 'everyone']
+
+# 特別セクションが選ばれる確率
+SPECIAL_PROBABILITY = 0.15
+
+# 公平ウェイトと特別セクション確率の既定値（tune_weights.py で調整可能）
+DEFAULT_WEIGHT_PARAMS = {
+    'base': 0.4,
+    'slope': 1.2,
+    'strength_step': 0.05,
+    'preference_step': 0.05,
+    'special_probability': SPECIAL_PROBABILITY,
+}
+
+# 難易度ごとのラウンド数
+DIFFICULTY_ROUNDS = {'soft': 12, 'normal': 15, 'hard': 20}
+
+# 難易度別の調整済みパラメータ（tune_weights.py の出力）
+WEIGHT_PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weight_profiles.json")
+
+def load_weight_profiles(path=WEIGHT_PROFILES_PATH):
+    """難易度別パラメータを読み込む（無ければ既定値）"""
+    profiles = {name: dict(DEFAULT_WEIGHT_PARAMS) for name in DIFFICULTY_ROUNDS}
+    if not os.path.exists(path):
+        return profiles
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for name, profile in data.get('profiles', {}).items():
+        params = dict(DEFAULT_WEIGHT_PARAMS)
+        params.update({k: float(v) for k, v in profile.get('params', {}).items() if k in DEFAULT_WEIGHT_PARAMS})
+        profiles[name] = params
+    return profiles
+
+def calculate_drink_amount(player, multiplier=1.0):
+    """飲み量を計算（倍率対応）"""
+    strength = player['strength']
+    preference = player['preference']
+
+    if strength <= 2:
+        if preference <= 2: base_multiplier = 0.5
+        elif preference == 3: base_multiplier = 0.75
+        else: base_multiplier = 1.0
+    elif strength == 3:
+        if preference <= 2: base_multiplier = 0.75
+        elif preference == 3: base_multiplier = 1.0
+        else: base_multiplier = 1.5
+    else:
+        if preference <= 3: base_multiplier = 1.5
+        else: base_multiplier = 2.0
+
+    return base_multiplier * multiplier
+
+def get_drink_display(multiplier, cup_type):
+    """飲み物の表示"""
+    if cup_type == 'おちょこ':
+        return f"おちょこ {multiplier:.1f}杯"
+    elif cup_type == 'ジョッキ':
+        return f"ジョッキ {multiplier*0.5:.1f}杯分"
+    else:
+        return f"おちょこ {multiplier:.1f}杯（またはジョッキ {multiplier*0.5:.1f}杯分）"
+
+def update_drunk_degree(player, multiplier):
+    """酔い度を更新"""
+    player['drunk_degree'] += multiplier * 10
+    player['drunk_degree'] = min(player['drunk_degree'], 100)
+    player['total_drunk'] += multiplier
+
+def calculate_player_weight(player, params=DEFAULT_WEIGHT_PARAMS):
+    """公平性を考慮した重み計算"""
+    # 酔い度が低いほど重くなる公平ウェイト
+    base = params['base'] + (1.0 - player["drunk_degree"]/100.0) * params['slope']
+    # 個人特性による微調整
+    adj = 1.0 + (5 - player["strength"]) * params['strength_step'] + (player["preference"] - 3) * params['preference_step']
+    weight = max(0.1, base * adj)
+    return weight
+
+def smart_player_selection(players, rng=random, params=DEFAULT_WEIGHT_PARAMS, sampler=None):
+    """AI強化版プレイヤー選択（sampler を渡すと重みの再計算を省略）"""
+    # 特別セクション判定（既定15%の確率）
+    if rng.random() < params['special_probability']:
+        selected_special = rng.choice(SPECIAL_TYPES)
+        return None, selected_special
+
+    # 通常のプレイヤー選択（重み付きランダム）
+    if sampler is not None:
+        return sampler.sample(rng), None
+
+    weights = [calculate_player_weight(p, params) for p in players]
+    selected_index = rng.choices(range(len(players)), weights=weights)[0]
+
+    return selected_index, None
+
+def _drunk_degree_stats(players):
+    """プレイヤーの並びから酔い度の平均・分散・最大・最小・ジニ係数を直接計算"""
+    drunk_degrees = sorted(p['drunk_degree'] for p in players)
+    n = len(drunk_degrees)
+    if n == 0:
+        return {'count': 0, 'avg_drunk': 0.0, 'variance': 0.0, 'max_drunk': 0.0, 'min_drunk': 0.0, 'gini': 0.0}
+    total = sum(drunk_degrees)
+    mean = total / n
+    # 昇順に並べた k 番目は、自分より小さい k 人との差に +、大きい n-1-k 人との差に - で効く
+    gap_sum = sum((2 * k - n + 1) * value for k, value in enumerate(drunk_degrees))
+    return {
+        'count': n,
+        'avg_drunk': mean,
+        'variance': sum((value - mean) ** 2 for value in drunk_degrees) / n,
+        'max_drunk': drunk_degrees[-1],
+        'min_drunk': drunk_degrees[0],
+        'gini': gap_sum / (n * total) if total > 0 else 0.0,
+    }
+
+def calculate_balance(players):
+    """酔い度の平均・分散・最大・最小・ジニ係数とバランススコアを計算
+
+    PlayerRoster なら差分で保っている集計値を使う。それ以外（dict のリストなど）は直接計算する。
+    """
+    if isinstance(players, PlayerRoster):
+        stats = players.balance_stats()
+    else:
+        stats = _drunk_degree_stats(players)
+    max_drunk = stats['max_drunk']
+    min_drunk = stats['min_drunk']
+
+    if max_drunk == min_drunk:
+        balance_score = 100
+    else:
+        balance_score = max(0, 100 - (max_drunk - min_drunk))
+
+    return dict(stats, balance_score=balance_score)
+
+def expected_shares(players):
+    """強さ・好みから見た各自の飲む量の取り分（1回に飲む量の比）"""
+    amounts = [calculate_drink_amount(p) for p in players]
+    total = sum(amounts)
+    return [amount / total for amount in amounts] if total > 0 else [0.0] * len(amounts)
+
+def share_gaps(players, expected):
+    """各自の実際の取り分と期待の取り分の差（ポイント）。まだ誰も飲んでいなければ全員0"""
+    total = players.total_drunk_sum() if isinstance(players, PlayerRoster) else sum(p['total_drunk'] for p in players)
+    if total <= 0:
+        return [0.0] * len(expected)
+    return [(p['total_drunk'] / total - share) * 100 for p, share in zip(players, expected)]
+
+def analyze_game_balance(players, round_count, expected=None):
+    """ゲームバランス分析（expected を渡すと期待の取り分からの最大のずれも表示）"""
+    if len(players) < 2:
+        return "分析データが不足しています。"
+
+    stats = calculate_balance(players)
+    balance_score = stats['balance_score']
+
+    analysis = f"""
+    **🎯 ゲームバランス分析（ラウンド {round_count}）**
+
+    **バランススコア**: {balance_score:.1f}/100
+    **平均酔い度**: {stats['avg_drunk']:.1f}%
+    **最大差**: {stats['max_drunk'] - stats['min_drunk']:.1f}%
+    **ばらつき（標準偏差）**: {stats['variance'] ** 0.5:.1f}%
+    **ジニ係数**: {stats['gini']:.3f}
+    """
+    if expected is not None:
+        gaps = share_gaps(players, expected)
+        analysis += f"**期待の取り分との最大のずれ**: {max(map(abs, gaps)):.1f}pt\n"
+
+    if balance_score >= 80:
+        analysis += "\n✅ **素晴らしいバランス**です！"
+    elif balance_score >= 60:
+        analysis += "\n⚖️ **良好なバランス**です。"
+    elif balance_score >= 40:
+        analysis += "\n⚠️ **やや不均衡**です。"
+    else:
+        analysis += "\n🚨 **バランス調整中**です。"
+
+    return analysis
+
+@dataclass
+class RoundResult:
+    """1ラウンドの結果"""
+    round_number: int
+    selected_index: Optional[int] = None
+    special: Optional[str] = None
+    target_index: Optional[int] = None
+    multiplier: Optional[float] = None
+    shield_consumed: bool = False
+    drink_display: Optional[str] = None
+    message: Optional[str] = None
+
+class GameEngine:
+    """Streamlit に依存しないゲーム進行エンジン
+
+    各ラウンドは RoundEvent として記録され、状態はその記録を再生して再現できる。
+    ラウンドの乱数はゲームのシードとラウンド番号だけで決まる。
+    """
+    def __init__(self, players, max_rounds=15, rng=None, params=None, seed=None):
+        self.players = players if isinstance(players, PlayerRoster) else PlayerRoster(players)
+        self.max_rounds = max_rounds
+        self.params = params if params is not None else DEFAULT_WEIGHT_PARAMS
+        self.round_count = 0
+        self.special_effects_active = {}
+        self.rng = rng if rng is not None else random.Random()
+        self.seed = seed if seed is not None else self.rng.getrandbits(32)
+        self.log = RoundLog()
+        # 強さ・好みから見た取り分はゲーム中に変わらないので1回だけ計算
+        self.expected_shares = expected_shares(self.players)
+        # ラウンドごとのバランス（calculate_balance の結果。index はラウンド番号 - 1）
+        self.balance_timeline = []
+        # 選択用の重みは酔い度が変わった人だけ更新する
+        self.sampler = FenwickSampler(self._player_weights())
+
+    @classmethod
+    def replay(cls, players, events, max_rounds=15, params=None, seed=None):
+        """記録を先頭から再生した状態のエンジンを作る"""
+        engine = cls(players, max_rounds=max_rounds, params=params, seed=seed)
+        for event in events:
+            engine.apply(event)
+        return engine
+
+    @property
+    def is_finished(self):
+        return self.round_count >= self.max_rounds
+
+    def has_shield(self, name):
+        """シールドが有効か"""
+        return self.special_effects_active.get(name, {}).get('shield', False)
+
+    def shielded_names(self):
+        """シールドを持っているプレイヤー名"""
+        return frozenset(p['name'] for p in self.players if self.has_shield(p['name']))
+
+    def reset(self, seed=None):
+        """同じメンバーで最初からやり直す（シードも新しくする）"""
+        self.players.reset_progress()
+        self.round_count = 0
+        self.special_effects_active = {}
+        self.seed = seed if seed is not None else self.rng.getrandbits(32)
+        self.log.clear()
+        self.balance_timeline.clear()
+        self.sampler.rebuild(self._player_weights())
+
+    def round_seed(self, round_number):
+        """そのラウンドの乱数シード（ゲームのシードとラウンド番号で決まる）"""
+        return random.Random(f"{self.seed}:{round_number}").getrandbits(32)
+
+    def snapshot(self):
+        return EngineSnapshot(round_count=self.round_count,
+                              progress=self.players.progress(),
+                              shields=self.shielded_names())
+
+    def restore(self, snapshot=None):
+        """スナップショット（None なら開始時点）の状態に戻す。記録はそのまま"""
+        if snapshot is None:
+            self.players.reset_progress()
+            self.round_count = 0
+            self.special_effects_active = {}
+        else:
+            self.players.restore_progress(snapshot.progress)
+            self.round_count = snapshot.round_count
+            self.special_effects_active = {name: {'shield': True} for name in snapshot.shields}
+        self.sampler.rebuild(self._player_weights())
+
+    def rewind(self, round_count):
+        """round_count ラウンド終了時点へ戻し、それより後の記録を捨てる
+
+        直前のスナップショットから再生するので、戻す距離によらずほぼ一定時間。
+        """
+        if not 0 <= round_count <= len(self.log):
+            raise ValueError(f"ラウンド {round_count} には戻せません（記録は {len(self.log)} ラウンド）")
+        snapshot = self.log.nearest_snapshot(round_count)
+        start = snapshot.round_count if snapshot is not None else 0
+        events = self.log.events[start:round_count]
+        self.log.truncate(round_count)
+        del self.balance_timeline[round_count:]
+        self.restore(snapshot)
+        for event in events:
+            self._apply(event)
+
+    def undo(self):
+        """直前のラウンドを取り消して、その記録を返す（無ければ None）"""
+        if not self.log.events:
+            return None
+        event = self.log.events[-1]
+        self.rewind(len(self.log) - 1)
+        return event
+
+    def verify_log(self):
+        """記録をシードから決め直して照合し、食い違った最初のラウンド番号を返す（一致なら None）
+
+        各ラウンドのシードがゲームのシードから決まる値かも確かめる（都合のよいシードへの差し替えを見抜く）。
+        """
+        engine = GameEngine(self.players.snapshot(), max_rounds=self.max_rounds, params=self.params, seed=self.seed)
+        for event in self.log:
+            if event.seed != self.round_seed(event.round_number):
+                return event.round_number
+            if engine.decide(event.round_number, event.seed) != event:
+                return event.round_number
+            engine.apply(event)
+        return None
+
+    def _player_weights(self):
+        return [calculate_player_weight(p, self.params) for p in self.players]
+
+    def share_gaps(self):
+        """各自の実際の取り分と、強さ・好みから見た期待の取り分との差（ポイント）"""
+        return share_gaps(self.players, self.expected_shares)
+
+    def likely_candidates(self, limit=None):
+        """次に選ばれやすい順のプレイヤー番号（シールド持ちは除く）"""
+        indices = [i for i, p in enumerate(self.players) if not self.has_shield(p['name'])]
+        indices.sort(key=lambda i: -self.sampler.weight(i))
+        return indices if limit is None else indices[:limit]
+
+    def preview_drink(self, index):
+        """index の人が通常どおり選ばれて飲んだ後の状態を、変更せずに dict で返す
+
+        戻り値は (選ばれた人, 全員) で、AIイベントの先読みに使う。
+        """
+        players = [{'name': p['name'], 'drunk_degree': p['drunk_degree'], 'total_drunk': p['total_drunk']}
+                   for p in self.players]
+        selected = players[index]
+        update_drunk_degree(selected, calculate_drink_amount(self.players[index]))
+        return selected, players
+
+    def drink(self, index, multiplier):
+        """1人に飲ませて、その人の選択ウェイトだけを更新"""
+        player = self.players[index]
+        update_drunk_degree(player, multiplier)
+        self.sampler.update(index, calculate_player_weight(player, self.params))
+
+    def drink_all(self, multiplier):
+        """全員に飲ませて、選択ウェイトを一括更新"""
+        with self.players.bulk_update():
+            for player in self.players:
+                update_drunk_degree(player, multiplier)
+        self.sampler.rebuild(self._player_weights())
+
+    def decide(self, round_number, seed):
+        """現在の状態とシードから、そのラウンドの結果を決める（状態は変えない）"""
+        rng = random.Random(seed)
+        selected_index, special = smart_player_selection(self.players, rng, self.params, self.sampler)
+        event = dict(round_number=round_number, seed=seed, selected_index=selected_index, special=special)
+
+        if special in ('shield', 'double'):
+            target_index = rng.randrange(len(self.players))
+            event['target_index'] = target_index
+            if special == 'double':
+                event['multiplier'] = calculate_drink_amount(self.players[target_index], 2.0)
+        elif special == 'everyone':
+            event['multiplier'] = 0.5
+        elif special is None:
+            selected_player = self.players[selected_index]
+            event['target_index'] = selected_index
+            # シールド効果の確認
+            if self.has_shield(selected_player['name']):
+                event['shield_consumed'] = True
+            else:
+                event['multiplier'] = calculate_drink_amount(selected_player)
+        return RoundEvent(**event)
+
+    def _apply(self, event):
+        """記録1件分だけ状態を進める"""
+        if event.special == 'shield':
+            name = self.players[event.target_index]['name']
+            self.special_effects_active.setdefault(name, {})['shield'] = True
+        elif event.special == 'double':
+            self.drink(event.target_index, event.multiplier)
+        elif event.special == 'everyone':
+            self.drink_all(event.multiplier)
+        elif event.shield_consumed:
+            # シールド消費
+            name = self.players[event.target_index]['name']
+            self.special_effects_active[name]['shield'] = False
+        else:
+            self.drink(event.target_index, event.multiplier)
+        self.round_count = event.round_number
+
+    def apply(self, event):
+        """記録を追加して状態を進め、画面表示用の RoundResult を返す"""
+        self.log.append(event)
+        self._apply(event)
+        self.balance_timeline.append(calculate_balance(self.players))
+        if self.log.wants_snapshot(self.round_count):
+            self.log.add_snapshot(self.snapshot())
+        return self.describe(event)
+
+    def describe(self, event):
+        """記録から表示用の RoundResult を作る"""
+        result = RoundResult(round_number=event.round_number,
+                             selected_index=event.selected_index,
+                             special=event.special,
+                             target_index=event.target_index,
+                             multiplier=event.multiplier,
+                             shield_consumed=event.shield_consumed)
+        target = self.players[event.target_index] if event.target_index is not None else None
+
+        if event.special == 'shield':
+            result.message = f"🛡️ **{target['name']}**さんにシールドが付与されました！"
+        elif event.special == 'double':
+            drink_info = get_drink_display(event.multiplier, target['cup_type'])
+            result.message = f"⚡ **{target['name']}**さんが倍々アタック！{drink_info}"
+        elif event.special == 'everyone':
+            result.message = "🍻 みんなで乾杯！全員でおちょこ半分ずつ飲みましょう！"
+        elif event.special:
+            result.message = "特別効果が発生しました！"
+        elif event.shield_consumed:
+            result.drink_display = "シールドで無効化！"
+        else:
+            result.drink_display = get_drink_display(event.multiplier, target['cup_type'])
+        return result
+
+    def step(self):
+        """ルーレットを1回まわしてラウンドを進める"""
+        round_number = self.round_count + 1
+        return self.apply(self.decide(round_number, self.round_seed(round_number)))
+
+    def auto_play(self, rounds=None):
+        """残りのラウンド（rounds を渡すとその数まで）を通常と同じ規則でまとめて進め、RoundResult の一覧を返す"""
+        remaining = self.max_rounds - self.round_count
+        count = remaining if rounds is None else max(0, min(rounds, remaining))
+        return [self.step() for _ in range(count)]
@@ -0,0 +1,220 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from round_log import RoundEvent
+
+# 既定の保存先（secrets の GAME_DB_PATH で変更可能）
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_history.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rosters (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS roster_players (
+    roster_id INTEGER NOT NULL REFERENCES rosters(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    strength INTEGER NOT NULL,
+    preference INTEGER NOT NULL,
+    cup_type TEXT NOT NULL,
+    PRIMARY KEY (roster_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    roster_id INTEGER NOT NULL REFERENCES rosters(id),
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    seed INTEGER NOT NULL,
+    difficulty TEXT,
+    max_rounds INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rounds (
+    game_id INTEGER NOT NULL REFERENCES games(id),
+    round_number INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    selected_index INTEGER,
+    special TEXT,
+    target_index INTEGER,
+    multiplier REAL,
+    shield_consumed INTEGER NOT NULL,
+    PRIMARY KEY (game_id, round_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS game_results (
+    game_id INTEGER NOT NULL REFERENCES games(id),
+    player_name TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    drunk_degree REAL NOT NULL,
+    total_drunk REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (game_id, rank)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS player_totals (
+    player_name TEXT PRIMARY KEY,
+    games INTEGER NOT NULL,
+    total_drunk REAL NOT NULL,
+    drunk_degree_sum REAL NOT NULL,
+    top_count INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rosters_created_at ON rosters(created_at);
+CREATE INDEX IF NOT EXISTS idx_games_started_at ON games(started_at);
+-- 集計に使う列まで含めて、表本体を読まずに済むようにする
+CREATE INDEX IF NOT EXISTS idx_game_results_player
+    ON game_results(player_name, finished_at, rank, drunk_degree, total_drunk);
+CREATE INDEX IF NOT EXISTS idx_game_results_finished_at
+    ON game_results(finished_at, player_name, rank, drunk_degree, total_drunk);
+"""
+
+class GameStore:
+    """参加者名簿と対戦履歴を保存する SQLite（WAL モード）
+
+    全セッションで1つの接続を共有し、書き込みは1ラウンドにつき1トランザクションにまとめる。
+    通算成績は player_totals にゲーム終了ごとに足し込んでおくので、件数によらず一定時間で読める。
+    """
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL では NORMAL でも電源断以外でコミット済みの内容は失われない
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def save_roster(self, players, created_at=None):
+        """名簿を保存して id を返す"""
+        created_at = time.time() if created_at is None else created_at
+        with self._transaction() as conn:
+            roster_id = conn.execute("INSERT INTO rosters (created_at) VALUES (?)", (created_at,)).lastrowid
+            conn.executemany(
+                "INSERT INTO roster_players (roster_id, position, name, strength, preference, cup_type)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(roster_id, i, str(p['name']), int(p['strength']), int(p['preference']), p['cup_type'])
+                 for i, p in enumerate(players)],
+            )
+        return roster_id
+
+    def load_roster(self, roster_id):
+        rows = self._query("SELECT name, strength, preference, cup_type FROM roster_players"
+                           " WHERE roster_id = ? ORDER BY position", (roster_id,))
+        return [{'name': name, 'strength': strength, 'preference': preference, 'cup_type': cup_type,
+                 'total_drunk': 0, 'drunk_degree': 0}
+                for name, strength, preference, cup_type in rows]
+
+    def last_roster(self):
+        """最後に保存した名簿を (id, 参加者) で返す（無ければ None）"""
+        rows = self._query("SELECT id FROM rosters ORDER BY created_at DESC LIMIT 1")
+        return (rows[0][0], self.load_roster(rows[0][0])) if rows else None
+
+    def start_game(self, roster_id, seed, max_rounds, difficulty=None, started_at=None):
+        """ゲームを登録して id を返す"""
+        started_at = time.time() if started_at is None else started_at
+        with self._transaction() as conn:
+            return conn.execute(
+                "INSERT INTO games (roster_id, started_at, seed, difficulty, max_rounds) VALUES (?, ?, ?, ?, ?)",
+                (roster_id, started_at, seed, difficulty, max_rounds),
+            ).lastrowid
+
+    def record_round(self, game_id, event):
+        """1ラウンド分の記録を保存（1トランザクション）"""
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO rounds VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (game_id,) + event.to_tuple())
+
+    def record_rounds(self, game_id, events):
+        """複数ラウンド分の記録をまとめて保存（自動進行用、1トランザクション）"""
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO rounds VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(game_id,) + event.to_tuple() for event in events])
+
+    def truncate_rounds(self, game_id, round_count):
+        """取り消しに合わせて round_count より後の記録を消し、終了済みなら未終了に戻す"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM rounds WHERE game_id = ? AND round_number > ?", (game_id, round_count))
+            self._remove_results(conn, game_id)
+            conn.execute("UPDATE games SET finished_at = NULL WHERE id = ?", (game_id,))
+
+    @staticmethod
+    def _remove_results(conn, game_id):
+        """保存済みの最終順位を消し、通算成績からも差し引く"""
+        rows = conn.execute("SELECT player_name, rank, drunk_degree, total_drunk FROM game_results"
+                            " WHERE game_id = ?", (game_id,)).fetchall()
+        conn.executemany(
+            "UPDATE player_totals SET games = games - 1, total_drunk = total_drunk - ?,"
+            " drunk_degree_sum = drunk_degree_sum - ?, top_count = top_count - ? WHERE player_name = ?",
+            [(total_drunk, drunk_degree, int(rank == 1), name) for name, rank, drunk_degree, total_drunk in rows],
+        )
+        conn.execute("DELETE FROM game_results WHERE game_id = ?", (game_id,))
+
+    def load_rounds(self, game_id):
+        rows = self._query("SELECT round_number, seed, selected_index, special, target_index, multiplier,"
+                           " shield_consumed FROM rounds WHERE game_id = ? ORDER BY round_number", (game_id,))
+        return [RoundEvent.from_tuple(row[:6] + (bool(row[6]),)) for row in rows]
+
+    def finish_game(self, game_id, ranking, finished_at=None):
+        """最終順位を保存してゲームを終了済みにする（ranking は酔い度の高い順）"""
+        finished_at = time.time() if finished_at is None else finished_at
+        results = [(str(p['name']), rank, float(p['drunk_degree']), float(p['total_drunk']))
+                   for rank, p in enumerate(ranking, 1)]
+        with self._transaction() as conn:
+            self._remove_results(conn, game_id)
+            conn.executemany("INSERT INTO game_results VALUES (?, ?, ?, ?, ?, ?)",
+                             [(game_id,) + row + (finished_at,) for row in results])
+            conn.executemany(
+                "INSERT INTO player_totals VALUES (?, 1, ?, ?, ?) ON CONFLICT(player_name) DO UPDATE SET"
+                " games = games + 1, total_drunk = total_drunk + excluded.total_drunk,"
+                " drunk_degree_sum = drunk_degree_sum + excluded.drunk_degree_sum,"
+                " top_count = top_count + excluded.top_count",
+                [(name, total_drunk, drunk_degree, int(rank == 1))
+                 for name, rank, drunk_degree, total_drunk in results],
+            )
+            conn.execute("UPDATE games SET finished_at = ? WHERE id = ?", (finished_at, game_id))
+
+    def player_stats(self, name):
+        """1人分の通算成績"""
+        rows = self._query("SELECT COUNT(*), SUM(total_drunk), AVG(drunk_degree), SUM(rank = 1), MAX(finished_at)"
+                           " FROM game_results WHERE player_name = ?", (name,))
+        games, total_drunk, avg_drunk, top_count, last_played = rows[0]
+        return {'name': name, 'games': games, 'total_drunk': total_drunk or 0.0, 'avg_drunk': avg_drunk or 0.0,
+                'top_count': top_count or 0, 'last_played': last_played}
+
+    def lifetime_stats(self, since=None, limit=20):
+        """通算成績（参加回数の多い順）。since を渡すとその日時以降のゲームだけを集計"""
+        if since is None:
+            rows = self._query(
+                "SELECT player_name, games, total_drunk, drunk_degree_sum / games, top_count FROM player_totals"
+                " WHERE games > 0 ORDER BY games DESC, player_name LIMIT ?", (limit,))
+        else:
+            rows = self._query(
+                "SELECT player_name, COUNT(*), SUM(total_drunk), AVG(drunk_degree), SUM(rank = 1)"
+                " FROM game_results INDEXED BY idx_game_results_finished_at WHERE finished_at >= ?"
+                " GROUP BY player_name ORDER BY COUNT(*) DESC, player_name LIMIT ?", (since, limit))
+        return [{'name': name, 'games': games, 'total_drunk': total_drunk, 'avg_drunk': avg_drunk,
+                 'top_count': top_count}
+                for name, games, total_drunk, avg_drunk, top_count in rows]
+
+    def game_count(self):
+        return self._query("SELECT COUNT(*) FROM games WHERE finished_at IS NOT NULL")[0][0]
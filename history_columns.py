@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from game_engine import SPECIAL_TYPES, GameEngine
+
+# 既定の保存先（secrets の HISTORY_DIR で変更可能）
+DEFAULT_HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")
+
+# 1行＝1ラウンドの1人分。列ごとに別ファイルへ追記する
+ROW_COLUMNS = {
+    'game': np.int32,          # ゲーム id
+    'round': np.int16,         # ラウンド番号
+    'player': np.int32,        # プレイヤー id（名前ごとに採番）
+    'drunk': np.float32,       # ラウンド終了時点の酔い度
+    'amount': np.float32,      # このラウンドで飲んだ量（杯）
+    'selected': np.int8,       # ルーレットで選ばれた人なら 1
+    'probability': np.float32, # 重みモデル上で選ばれる確率
+    'special': np.int8,        # 0: 通常、1以降: SPECIAL_TYPES の順
+    'batch': np.int32,         # 追記の通し番号（同じゲームを書き直したら新しい方を使う）
+}
+# 追記1回ごとの情報
+BATCH_COLUMNS = {
+    'batch_game': np.int32,
+    'batch_time': np.float64,
+}
+SPECIAL_CODES = {special: code for code, special in enumerate(SPECIAL_TYPES, 1)}
+
+def game_rows(engine):
+    """終了したゲームの記録を再生して、1ラウンド1人分ずつの列データ（NumPy 配列）にする"""
+    replay = GameEngine(engine.players.snapshot(), max_rounds=engine.max_rounds, params=engine.params,
+                        seed=engine.seed)
+    n = len(replay.players)
+    normal_probability = 1.0 - replay.params['special_probability']
+    totals = np.zeros(n)
+    chunks = []
+    for event in engine.log:
+        weights = np.fromiter((replay.sampler.weight(i) for i in range(n)), dtype=np.float64, count=n)
+        replay.apply(event)
+        new_totals = np.fromiter((p['total_drunk'] for p in replay.players), dtype=np.float64, count=n)
+        selected = np.zeros(n, dtype=np.int8)
+        if event.special is None:
+            selected[event.selected_index] = 1
+        chunks.append({
+            'round': np.full(n, event.round_number),
+            'player_index': np.arange(n),
+            'drunk': replay.players.drunk_degrees().copy(),
+            'amount': new_totals - totals,
+            'selected': selected,
+            'probability': weights / weights.sum() * normal_probability,
+            'special': np.full(n, SPECIAL_CODES.get(event.special, 0)),
+        })
+        totals = new_totals
+    if not chunks:
+        return {column: np.empty(0) for column in ('round', 'player_index', 'drunk', 'amount', 'selected',
+                                                   'probability', 'special')}
+    return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+
+class ColumnarHistory:
+    """ラウンドごとの数値データを列ごとの追記専用ファイルに保存し、メモリマップで読む
+
+    集計はすべて NumPy のベクトル演算で行う。同じゲームを取り消し後に書き直した場合は、
+    新しい追記（batch）の行だけを使う。
+    """
+    def __init__(self, directory=DEFAULT_HISTORY_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._names_path = os.path.join(directory, "players.txt")
+        self._player_ids = {}
+        self.player_names = []
+        if os.path.exists(self._names_path):
+            with open(self._names_path, encoding="utf-8") as f:
+                for line in f:
+                    self._add_name(line.rstrip("\n"))
+
+    def _add_name(self, name):
+        self._player_ids[name] = len(self.player_names)
+        self.player_names.append(name)
+
+    def _path(self, column):
+        return os.path.join(self.directory, f"{column}.bin")
+
+    def _player_id(self, name, new_names):
+        if name not in self._player_ids:
+            self._add_name(name)
+            new_names.append(name)
+        return self._player_ids[name]
+
+    def _length(self, columns):
+        """全列がそろっている行数（書き込み途中で止まった列があっても短い方に合わせる）"""
+        lengths = []
+        for column, dtype in columns.items():
+            path = self._path(column)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            lengths.append(size // np.dtype(dtype).itemsize)
+        return min(lengths)
+
+    def append_game(self, game_id, engine, finished_at=None):
+        """終了したゲーム1件分を追記"""
+        rows = game_rows(engine)
+        finished_at = time.time() if finished_at is None else finished_at
+        with self._lock:
+            new_names = []
+            player_ids = [self._player_id(p['name'], new_names) for p in engine.players]
+            batch = self._length(BATCH_COLUMNS)
+            data = {
+                'game': np.full(len(rows['round']), game_id, dtype=np.int32),
+                'round': np.asarray(rows['round'], dtype=np.int16),
+                'player': np.asarray(player_ids, dtype=np.int32)[np.asarray(rows['player_index'], dtype=np.intp)],
+                'drunk': np.asarray(rows['drunk'], dtype=np.float32),
+                'amount': np.asarray(rows['amount'], dtype=np.float32),
+                'selected': np.asarray(rows['selected'], dtype=np.int8),
+                'probability': np.asarray(rows['probability'], dtype=np.float32),
+                'special': np.asarray(rows['special'], dtype=np.int8),
+                'batch': np.full(len(rows['round']), batch, dtype=np.int32),
+            }
+            self._append(data, ROW_COLUMNS)
+            self._append({'batch_game': np.array([game_id], dtype=np.int32),
+                          'batch_time': np.array([finished_at], dtype=np.float64)}, BATCH_COLUMNS)
+            self._save_names(new_names)
+
+    def append_columns(self, rows, batch_games, batch_times, player_names=()):
+        """まとめて追記（移行・ベンチマーク用）。rows['batch'] は今回の追記内での 0 始まりの番号"""
+        with self._lock:
+            new_names = []
+            for name in player_names:
+                self._player_id(name, new_names)
+            offset = self._length(BATCH_COLUMNS)
+            rows = dict(rows, batch=np.asarray(rows['batch']) + offset)
+            self._append(rows, ROW_COLUMNS)
+            self._append({'batch_game': batch_games, 'batch_time': batch_times}, BATCH_COLUMNS)
+            self._save_names(new_names)
+
+    def _save_names(self, new_names):
+        if new_names:
+            with open(self._names_path, "a", encoding="utf-8") as f:
+                f.writelines(name + "\n" for name in new_names)
+
+    def _append(self, data, columns):
+        # 途中で止まった列の端数を切り詰めてから、全列に同じ行数を足す
+        length = self._length(columns)
+        for column, dtype in columns.items():
+            path = self._path(column)
+            with open(path, "ab") as f:
+                f.truncate(length * np.dtype(dtype).itemsize)
+                f.write(np.ascontiguousarray(data[column], dtype=dtype).tobytes())
+
+    def columns(self):
+        """全行の列（読み取り専用のメモリマップ）と追記情報"""
+        with self._lock:
+            rows = self._length(ROW_COLUMNS)
+            batches = self._length(BATCH_COLUMNS)
+        return (
+            {column: self._map(column, dtype, rows) for column, dtype in ROW_COLUMNS.items()},
+            {column: self._map(column, dtype, batches) for column, dtype in BATCH_COLUMNS.items()},
+        )
+
+    def _map(self, column, dtype, length):
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(column), dtype=dtype, mode='r', shape=(length,))
+
+    def load(self):
+        """取り消しで書き直されたゲームの古い行を除いた HistoryFrame"""
+        rows, batches = self.columns()
+        if len(batches['batch_game']) == 0 or len(rows['game']) == 0:
+            return HistoryFrame.empty(self.player_names)
+        # ゲームごとに最後の追記だけを残す
+        batch_game = np.asarray(batches['batch_game'])
+        latest = np.full(batch_game.max() + 1, -1, dtype=np.int64)
+        np.maximum.at(latest, batch_game, np.arange(len(batch_game)))
+        batch = np.asarray(rows['batch'])
+        keep = latest[np.asarray(rows['game'])] == batch
+        if keep.all():
+            data = rows
+        else:
+            data = {column: np.asarray(values)[keep] for column, values in rows.items()}
+        return HistoryFrame(data, np.asarray(batches['batch_time']), self.player_names)
+
+class HistoryFrame:
+    """履歴の列データに対するベクトル化された集計"""
+    def __init__(self, rows, batch_time, player_names):
+        self.rows = rows
+        self.batch_time = batch_time
+        self.player_names = player_names
+        self._round_balance = None
+        game, rnd = rows['game'], rows['round']
+        # 行はゲーム・ラウンドごとにまとまって並んでいるので、境目の位置でグループ化できる
+        if len(game):
+            change = np.flatnonzero((game[1:] != game[:-1]) | (rnd[1:] != rnd[:-1])) + 1
+            self.round_starts = np.concatenate(([0], change))
+        else:
+            self.round_starts = np.empty(0, dtype=np.intp)
+
+    @classmethod
+    def empty(cls, player_names=()):
+        rows = {column: np.empty(0, dtype=dtype) for column, dtype in ROW_COLUMNS.items()}
+        return cls(rows, np.empty(0, dtype=np.float64), list(player_names))
+
+    def __len__(self):
+        return len(self.rows['game'])
+
+    @property
+    def num_rounds(self):
+        return len(self.round_starts)
+
+    def round_balance(self):
+        """ラウンドごとの (ゲーム id, ラウンド番号, 終了時刻, バランススコア)（一度だけ計算）"""
+        if self._round_balance is None:
+            self._round_balance = self._compute_round_balance()
+        return self._round_balance
+
+    def _compute_round_balance(self):
+        if not len(self):
+            empty = np.empty(0)
+            return empty, empty, empty, empty
+        drunk = self.rows['drunk']
+        spread = np.maximum.reduceat(drunk, self.round_starts) - np.minimum.reduceat(drunk, self.round_starts)
+        score = np.clip(100.0 - spread, 0.0, 100.0)
+        times = self.batch_time[self.rows['batch'][self.round_starts]]
+        return self.rows['game'][self.round_starts], self.rows['round'][self.round_starts], times, score
+
+    def balance_by_round_number(self):
+        """ラウンド番号ごとの平均バランススコア（ゲーム進行に伴う推移）"""
+        _, rounds, _, score = self.round_balance()
+        if not len(score):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        counts = np.bincount(rounds)
+        sums = np.bincount(rounds, weights=score)
+        present = np.flatnonzero(counts)
+        return present, sums[present] / counts[present]
+
+    def final_balance(self):
+        """ゲームごとの (終了時刻, 最終バランススコア)（時刻順）"""
+        games, _, times, score = self.round_balance()
+        if not len(score):
+            return np.empty(0), np.empty(0)
+        last = np.flatnonzero(np.append(games[1:] != games[:-1], True))
+        order = np.argsort(times[last], kind='stable')
+        return times[last][order], score[last][order]
+
+    def selection_vs_model(self):
+        """プレイヤーごとの (名前, 選ばれた回数, 重みモデルでの期待回数, 参加ラウンド数)"""
+        player = self.rows['player']
+        size = len(self.player_names)
+        observed = np.bincount(player, weights=self.rows['selected'], minlength=size)
+        expected = np.bincount(player, weights=self.rows['probability'], minlength=size)
+        rounds = np.bincount(player, minlength=size)
+        present = np.flatnonzero(rounds)
+        return [self.player_names[i] for i in present], observed[present], expected[present], rounds[present]
+
+    def special_frequency(self):
+        """特別セクションごとの発生回数と、全ラウンドに占める割合"""
+        codes = self.rows['special'][self.round_starts]
+        counts = np.bincount(codes, minlength=len(SPECIAL_TYPES) + 1)
+        total = max(1, self.num_rounds)
+        return {special: (int(counts[code]), counts[code] / total) for special, code in SPECIAL_CODES.items()}
+
+def downsample(x, y, max_points=2000):
+    """折れ線用に間引く：バケットごとに (中央の x, 平均, 最小, 最大) を返す"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= max_points:
+        return x, y, y, y
+    edges = np.linspace(0, len(x), max_points + 1).astype(np.intp)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    sums = np.add.reduceat(y, starts)
+    centers = x[starts + counts // 2]
+    return centers, sums / counts, np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)
@@ -0,0 +1,211 @@
+import cProfile
+import os
+import pstats
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 区間の時間のヒストグラムの区切り（秒）
+SPAN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus に出すメトリクス名の接頭辞
+METRIC_PREFIX = "balancer_"
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+class MetricsRegistry:
+    """プロセス全体で共有するカウンタとヒストグラム（Prometheus のテキスト形式で出力）"""
+    def __init__(self, buckets=SPAN_BUCKETS, prefix=METRIC_PREFIX):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._last_export = 0.0
+
+    def describe(self, name, text):
+        """メトリクスの説明（# HELP 行）"""
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # 区切りごとの件数（最後は +Inf）、合計、件数
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = histogram[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def to_prometheus(self):
+        """Prometheus のテキスト形式（version 0.0.4）"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, ([*counts], total, count)) for key, (counts, total, count)
+                                in self._histograms.items())
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {self.prefix}{name} {self._help[name]}")
+                lines.append(f"# TYPE {self.prefix}{name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{self.prefix}{name}{_label_text(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.prefix}{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.prefix}{name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{self.prefix}{name}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export_file(self, path, min_interval=5.0):
+        """前回から min_interval 秒以上たっていればファイルに書き出す（書き換えは一括で置き換え）"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_export < min_interval:
+                return False
+            self._last_export = now
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+        return True
+
+    def serve(self, port, host="127.0.0.1"):
+        """/metrics を返す HTTP サーバーをデーモンスレッドで起動して返す"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+class RerunTrace:
+    """1回の再実行で計った区間の時間（必要なら cProfile も）
+
+    finish() の後に記録した区間（フラグメント単独の再実行など）は、一覧には足さず
+    MetricsRegistry のヒストグラムにだけ入れる（一覧が際限なく伸びないように）。
+    """
+    def __init__(self, metrics, profile=False):
+        self.metrics = metrics
+        self.spans = []
+        self.finished = False
+        self.started = time.perf_counter()
+        self.profiler = cProfile.Profile() if profile else None
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        if not self.finished:
+            self.spans.append((name, seconds))
+        self.metrics.observe("span_seconds", seconds, span=name)
+
+    def count(self, name, amount=1, **labels):
+        self.metrics.inc(name, amount, **labels)
+
+    def stop(self):
+        """cProfile を止める（st.rerun() などで最後まで進まなかった再実行の後始末にも使う）"""
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def finish(self):
+        """再実行全体の時間を記録して、計測を止める"""
+        self.stop()
+        self.record("rerun", time.perf_counter() - self.started)
+        self.count("reruns_total")
+        self.finished = True
+
+    def totals(self):
+        """区間名ごとの (回数, 合計秒)。記録した順"""
+        totals = {}
+        for name, seconds in self.spans:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + seconds)
+        return totals
+
+    def top_functions(self, limit=15):
+        """cProfile の累積時間の上位を (関数, 呼び出し回数, 自身の秒, 累積秒) で返す"""
+        if self.profiler is None:
+            return []
+        stats = pstats.Stats(self.profiler).stats
+        rows = sorted(stats.items(), key=lambda item: -item[1][3])[:limit]
+        return [(f"{os.path.basename(filename)}:{line}({function})", calls, own, cumulative)
+                for (filename, line, function), (_, calls, own, cumulative, _) in rows]
+
+class NullTrace:
+    """計測が無効なときの代わり（何も記録しない）"""
+    spans = ()
+
+    def span(self, name):
+        return nullcontext()
+
+    def record(self, name, seconds):
+        pass
+
+    def count(self, name, amount=1, **labels):
+        pass
+
+    def stop(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def totals(self):
+        return {}
+
+    def top_functions(self, limit=15):
+        return []
@@ -0,0 +1,181 @@
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, replace
+from typing import Optional
+
+# ルームコードに使う文字（読み間違えやすい 0/O・1/I/L を除く）
+ROOM_CODE_ALPHABET = "23456789ABCDEFGHJKMNPQRSTUVWXYZ"
+ROOM_CODE_LENGTH = 5
+
+# 名簿を分割する数。ルームの出し入れはコードが属する区画のロックだけを取る
+ROOM_SHARDS = 64
+
+# これだけ更新の無いルームは、同じ区画で新しいルームを作るときに片付ける（秒）
+ROOM_IDLE_SECONDS = 6 * 60 * 60
+
+# 閉じたルームは観戦者に「閉じられた」と伝えるため、この秒数だけ残してから片付ける
+ROOM_CLOSED_SECONDS = 10 * 60
+
+# 観戦者が最後に確認しに来てからこの秒数以内なら「観戦中」に数える
+VIEWER_ACTIVE_SECONDS = 10.0
+
+@dataclass(frozen=True)
+class PlayerState:
+    """観戦画面に出す1人分"""
+    name: str
+    drunk_degree: float
+    total_drunk: float
+    shielded: bool
+
+@dataclass(frozen=True)
+class RoomState:
+    """ホストが公開したゲームの状態（観戦者はエンジンに触れず、これだけを読む）"""
+    version: int = 0
+    game_state: str = 'playing'
+    round_count: int = 0
+    max_rounds: int = 0
+    players: tuple = ()
+    balance_score: float = 100.0
+    spinning: bool = False
+    last_selected: Optional[str] = None
+    last_drink: Optional[str] = None
+    last_special_effect: Optional[str] = None
+    ai_event_description: Optional[str] = None
+
+    @classmethod
+    def from_engine(cls, engine, game_state='playing', **display):
+        """エンジンの現在の状態から作る（ホスト側のスレッドで呼ぶ）"""
+        shielded = engine.shielded_names()
+        players = tuple(PlayerState(p['name'], p['drunk_degree'], p['total_drunk'], p['name'] in shielded)
+                        for p in engine.players.ranking())
+        balance = engine.balance_timeline[-1]['balance_score'] if engine.balance_timeline else 100.0
+        return cls(game_state=game_state, round_count=engine.round_count, max_rounds=engine.max_rounds,
+                   players=players, balance_score=balance, **display)
+
+class Room:
+    """1つのゲームを共有するルーム
+
+    状態の更新はルームごとのロックで行うので、ほかのルームの更新とは待ち合わせない。
+    観戦者は待ち受けず、定期的に check() で最新の状態を読む（スレッドを止めておかない）。
+    """
+    def __init__(self, code, host_token, state, clock=time.monotonic):
+        self.code = code
+        self.host_token = host_token
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = replace(state, version=1)
+        self._viewers = {}
+        self.updated_at = clock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_host(self, token):
+        return token is not None and token == self.host_token
+
+    @property
+    def closed(self):
+        return self._state.game_state == 'closed'
+
+    def publish(self, state):
+        """新しい状態を公開する。内容が変わらないか、閉じた後なら何もしない"""
+        with self._lock:
+            current = self._state
+            if current.game_state == 'closed' or replace(state, version=current.version) == current:
+                return current
+            self._state = replace(state, version=current.version + 1)
+            self.updated_at = self._clock()
+            return self._state
+
+    def check(self, viewer=None):
+        """待たずに最新の状態を返す（viewer を渡すと観戦中として数える）"""
+        with self._lock:
+            if viewer is not None:
+                self._viewers[viewer] = self._clock()
+            return self._state
+
+    def viewer_count(self):
+        """最近確認しに来た観戦者の数"""
+        now = self._clock()
+        with self._lock:
+            stale = [viewer for viewer, seen in self._viewers.items() if now - seen > VIEWER_ACTIVE_SECONDS]
+            for viewer in stale:
+                del self._viewers[viewer]
+            return len(self._viewers)
+
+class RoomStore:
+    """プロセス内で共有するルームの一覧（コード → Room）
+
+    全体で1つのロックにすると、数百のルームの出し入れがすべて直列になる。
+    コードのハッシュで区画に分け、区画ごとのロックだけを取る。
+    """
+    def __init__(self, shards=ROOM_SHARDS, idle_seconds=ROOM_IDLE_SECONDS, closed_seconds=ROOM_CLOSED_SECONDS,
+                 rng=None, clock=time.monotonic):
+        self.idle_seconds = idle_seconds
+        self.closed_seconds = closed_seconds
+        self._rng = rng if rng is not None else random.SystemRandom()
+        self._clock = clock
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, code):
+        return self._shards[zlib.crc32(code.encode()) % len(self._shards)]
+
+    def _new_code(self):
+        return "".join(self._rng.choice(ROOM_CODE_ALPHABET) for _ in range(ROOM_CODE_LENGTH))
+
+    @staticmethod
+    def normalize_code(code):
+        return (code or "").strip().upper()
+
+    def create(self, host_token, state):
+        """ルームを作って返す（コードは未使用のものを選ぶ）"""
+        while True:
+            code = self._new_code()
+            rooms, lock = self._shard(code)
+            with lock:
+                self._prune(rooms)
+                if code not in rooms:
+                    room = Room(code, host_token, state, clock=self._clock)
+                    rooms[code] = room
+                    return room
+
+    def _prune(self, rooms):
+        """区画内の放置されたルームと、閉じてから時間のたったルームを片付ける（区画のロックを持った状態で呼ぶ）"""
+        now = self._clock()
+        expired = [code for code, room in rooms.items()
+                   if now - room.updated_at > (self.closed_seconds if room.closed else self.idle_seconds)]
+        for code in expired:
+            del rooms[code]
+
+    def get(self, code):
+        """コードのルーム（無ければ None）"""
+        code = self.normalize_code(code)
+        rooms, lock = self._shard(code)
+        with lock:
+            return rooms.get(code)
+
+    def close(self, code, host_token):
+        """ホストだけがルームを閉じられる。閉じたら True
+
+        観戦者が「見つからない」ではなく「閉じられた」と分かるよう、閉じた状態を公開したまま
+        closed_seconds の間は一覧に残す（片付けは _prune で行う）。
+        """
+        code = self.normalize_code(code)
+        rooms, lock = self._shard(code)
+        with lock:
+            room = rooms.get(code)
+            if room is None or room.closed or not room.is_host(host_token):
+                return False
+        room.publish(replace(room.state, game_state='closed'))
+        return True
+
+    def __len__(self):
+        """開いているルームの数"""
+        total = 0
+        for rooms, lock in self._shards:
+            with lock:
+                total += sum(not room.closed for room in rooms.values())
+        return total
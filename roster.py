@@ -0,0 +1,239 @@
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+# 参加時に決まり、ゲーム中は変わらない属性
+STATIC_FIELDS = ('name', 'strength', 'preference', 'cup_type')
+# ラウンドごとに変わる属性
+PROGRESS_FIELDS = ('drunk_degree', 'total_drunk')
+
+class PlayerView:
+    """PlayerRoster の1人分を dict と同じ書き方で読み書きするビュー"""
+    __slots__ = ('_roster', '_index')
+
+    def __init__(self, roster, index):
+        self._roster = roster
+        self._index = index
+
+    @property
+    def index(self):
+        return self._index
+
+    def __getitem__(self, key):
+        roster = self._roster
+        i = self._index
+        if key == 'drunk_degree':
+            return roster._drunk_degree[i]
+        if key == 'total_drunk':
+            return roster._total_drunk[i]
+        if key == 'name':
+            return roster._names[i]
+        if key == 'strength':
+            return roster._strength[i]
+        if key == 'preference':
+            return roster._preference[i]
+        if key == 'cup_type':
+            return roster._cup_types[i]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'drunk_degree':
+            self._roster._set_drunk_degree(self._index, value)
+        elif key == 'total_drunk':
+            self._roster._set_total_drunk(self._index, value)
+        else:
+            raise KeyError(f"{key} はゲーム中に変更できません")
+
+    def __contains__(self, key):
+        return key in STATIC_FIELDS or key in PROGRESS_FIELDS
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return STATIC_FIELDS + PROGRESS_FIELDS
+
+    def copy(self):
+        """通常の dict として複製"""
+        return {key: self[key] for key in self.keys()}
+
+    def __repr__(self):
+        return f"PlayerView({self.copy()!r})"
+
+class PlayerRoster:
+    """参加者を列ごとの配列で保持する名簿
+
+    属性列は snapshot() 間で共有（ゼロコピー）し、酔い度・総飲酒量だけを
+    名簿ごとに持つ。酔い度順の順位と、バランス分析に使う合計・二乗和・
+    全ペアの差の合計は、その人が飲むたびに差分で更新する。
+    """
+    def __init__(self, players=(), _static=None):
+        if _static is None:
+            players = list(players)
+            _static = (
+                tuple(str(p['name']) for p in players),
+                array('b', (int(p['strength']) for p in players)),
+                array('b', (int(p['preference']) for p in players)),
+                tuple(p['cup_type'] for p in players),
+            )
+            drunk_degree = [float(p.get('drunk_degree', 0)) for p in players]
+            total_drunk = [float(p.get('total_drunk', 0)) for p in players]
+        else:
+            drunk_degree = total_drunk = [0.0] * len(_static[0])
+
+        self._static = _static
+        self._names, self._strength, self._preference, self._cup_types = _static
+        self._drunk_degree = array('d', drunk_degree)
+        self._total_drunk = array('d', total_drunk)
+        self._views = [PlayerView(self, i) for i in range(len(self._names))]
+        self._defer_ranking = False
+
+        # 順位（酔い度の降順、同値は登録順）
+        self._order = list(range(len(self._names)))
+        self._order.sort(key=lambda i: -self._drunk_degree[i])
+        self._recompute_stats()
+
+    def __len__(self):
+        return len(self._views)
+
+    def __getitem__(self, index):
+        return self._views[index]
+
+    def __iter__(self):
+        return iter(self._views)
+
+    @property
+    def names(self):
+        return self._names
+
+    def drunk_degrees(self):
+        """酔い度の配列（コピーなしの NumPy ビュー、読み取り用）"""
+        view = np.frombuffer(self._drunk_degree, dtype=np.float64)
+        view.flags.writeable = False
+        return view
+
+    def snapshot(self):
+        """属性列を共有し、酔い度・総飲酒量が0の新しい名簿を作る"""
+        return PlayerRoster(_static=self._static)
+
+    def reset_progress(self):
+        """全員の酔い度・総飲酒量を0に戻す（一括）"""
+        np.frombuffer(self._drunk_degree, dtype=np.float64)[:] = 0
+        np.frombuffer(self._total_drunk, dtype=np.float64)[:] = 0
+        self._order.sort()
+        self._recompute_stats()
+
+    def progress(self):
+        """酔い度・総飲酒量の複製（スナップショット用）"""
+        return array('d', self._drunk_degree), array('d', self._total_drunk)
+
+    def restore_progress(self, progress):
+        """progress() で取った酔い度・総飲酒量に戻す"""
+        drunk_degree, total_drunk = progress
+        self._drunk_degree[:] = drunk_degree
+        self._total_drunk[:] = total_drunk
+        self.refresh_ranking()
+        self._recompute_stats()
+
+    def ranking(self):
+        """酔い度の高い順のプレイヤー（並べ替え済みの順位をそのまま返す）"""
+        views = self._views
+        return [views[i] for i in self._order]
+
+    def refresh_ranking(self):
+        """全員の酔い度が変わった後に順位を付け直す"""
+        drunk = self._drunk_degree
+        # ほぼ整列済みなので timsort はほぼ線形
+        self._order.sort(key=lambda i: (-drunk[i], i))
+
+    @contextmanager
+    def bulk_update(self):
+        """全員の酔い度をまとめて変えるときは、最後に1回だけ順位を付け直す"""
+        self._defer_ranking = True
+        try:
+            yield self
+        finally:
+            self._defer_ranking = False
+            self.refresh_ranking()
+            self._recompute_stats()
+
+    def _recompute_stats(self):
+        """酔い度・総飲酒量の集計値を作り直す（一括更新・復元の後だけ）"""
+        drunk = np.frombuffer(self._drunk_degree, dtype=np.float64)
+        self._drunk_sum = float(drunk.sum())
+        self._drunk_square_sum = float(np.dot(drunk, drunk))
+        # 昇順に並べると 全ペアの差の合計 = Σ (2k - n + 1) * x_k
+        n = len(drunk)
+        self._gap_sum = float(np.dot(2 * np.arange(n) - n + 1, np.sort(drunk)))
+        self._total_sum = float(np.frombuffer(self._total_drunk, dtype=np.float64).sum())
+
+    def balance_stats(self):
+        """酔い度の平均・分散・最大・最小・ジニ係数（差分で保っている集計値から O(1)）"""
+        n = len(self._order)
+        if n == 0:
+            return {'count': 0, 'avg_drunk': 0.0, 'variance': 0.0, 'max_drunk': 0.0, 'min_drunk': 0.0,
+                    'gini': 0.0}
+        drunk = self._drunk_degree
+        mean = self._drunk_sum / n
+        # 丸め誤差で負にならないようにする
+        variance = max(0.0, self._drunk_square_sum / n - mean * mean)
+        gini = self._gap_sum / (n * self._drunk_sum) if self._drunk_sum > 0 else 0.0
+        return {
+            'count': n,
+            'avg_drunk': mean,
+            'variance': variance,
+            'max_drunk': drunk[self._order[0]],
+            'min_drunk': drunk[self._order[-1]],
+            'gini': min(1.0, max(0.0, gini)),
+        }
+
+    def total_drunk_sum(self):
+        """全員の総飲酒量の合計"""
+        return self._total_sum
+
+    def _rank_position(self, value, index):
+        """順位リスト中で (酔い度 value, 番号 index) が入る位置を二分探索"""
+        drunk = self._drunk_degree
+        order = self._order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            other = order[mid]
+            if drunk[other] > value or (drunk[other] == value and other < index):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _set_total_drunk(self, index, value):
+        self._total_sum += value - self._total_drunk[index]
+        self._total_drunk[index] = value
+
+    def _set_drunk_degree(self, index, value):
+        drunk = self._drunk_degree
+        if self._defer_ranking:
+            drunk[index] = value
+            return
+        old = drunk[index]
+        if value == old:
+            return
+
+        self._drunk_sum += value - old
+        self._drunk_square_sum += value * value - old * old
+
+        # 旧位置から外して新しい位置へ差し込む（探索 O(log n)、移動は list の memmove）
+        order = self._order
+        position = self._rank_position(old, index)
+        order.pop(position)
+        drunk[index] = value
+        new_position = self._rank_position(value, index)
+        # 全ペアの差の合計：追い越さなかった人との差は一律に |value - old| ずつ増減するので、
+        # 個別に足すのは旧位置と新位置の間にいた（追い越した）人だけ
+        low, high = min(position, new_position), max(position, new_position)
+        passed = sum(value + old - 2 * drunk[other] for other in order[low:high])
+        self._gap_sum += (value - old) * (len(order) - high - low) + (passed if value > old else -passed)
+        order.insert(new_position, index)
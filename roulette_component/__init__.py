@@ -0,0 +1,57 @@
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from roulette_render import calculate_target_rotation, section_index, wheel_layout
+
+# フロントエンド（ビルド不要の静的HTML）
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+_roulette_component = components.declare_component("balancer_roulette", path=_FRONTEND_DIR)
+
+# 送信済みの盤面と、処理済みの盤面要求を覚えておくセッションキー
+_LAYOUT_SENT_KEY = "_roulette_layout_sent"
+_LAYOUT_REQUEST_KEY = "_roulette_layout_request"
+
+def forget_layout():
+    """ルーレットが画面から外れたときに呼ぶ（次回の表示で盤面を送り直す）"""
+    st.session_state[_LAYOUT_SENT_KEY] = None
+
+def roulette(players, selected_index=None, selected_special=None, spinning=False, spin_id=None,
+             shielded_names=frozenset(), renderer='auto', height=550, key=None):
+    """ルーレットを描画し、回転アニメーションが完了した spin_id を返す
+
+    盤面（スタイル・ラベル）は参加者が変わったときだけ送り、以降は回転角度・
+    シールド・強調表示のみの小さな JSON で iframe を作り直さずに更新する。
+    renderer='auto' では大人数のとき SVG の盤面に切り替わる。
+    """
+    names = tuple(str(p['name']) for p in players)
+    layout = wheel_layout(names, renderer)
+    layout_sent = st.session_state.get(_LAYOUT_SENT_KEY) == layout['key']
+
+    value = _roulette_component(
+        layout_key=layout['key'],
+        layout=None if layout_sent else layout,
+        rotation=calculate_target_rotation(len(names), selected_index, selected_special),
+        spinning=spinning,
+        spin_id=spin_id,
+        shielded=[i for i, name in enumerate(names) if name in shielded_names],
+        highlight=section_index(len(names), selected_index, selected_special),
+        height=height,
+        key=key,
+        default=None,
+    )
+    st.session_state[_LAYOUT_SENT_KEY] = layout['key']
+
+    if not isinstance(value, dict):
+        return None
+
+    # 再マウントなどで盤面を失ったフロントエンドからの要求
+    if value.get('event') == 'need_layout' and value.get('nonce') != st.session_state.get(_LAYOUT_REQUEST_KEY):
+        st.session_state[_LAYOUT_REQUEST_KEY] = value.get('nonce')
+        forget_layout()
+        st.rerun()
+
+    if value.get('event') == 'spin_complete':
+        return value.get('spin_id')
+    return None
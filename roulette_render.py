@@ -0,0 +1,394 @@
+import hashlib
+import json
+import math
+import random
+from functools import lru_cache
+
+# ルーレットの色
+PLAYER_COLORS = ['#FF6666', '#4ECDCA', '#4587D1', '#FFA07A', '#98D8C8',
+                 '#F7DC6F', '#88BFCE', '#B5C1E2', '#B8B195', '#C8C6B4',
+                 '#6C5E7B', '#355C70']
+SPECIAL_COLORS = ['#3498db', '#e74c3c', '#f39c12']  # シールド、倍々、みんなで乾杯
+SPECIAL_NAMES = ['🛡️ シールド', '⚡ 倍々', '🍻 乾杯']
+SPECIAL_INDEX = {'shield': 0, 'double': 1, 'everyone': 2}
+
+# 盤面（名前・シールド）の組み合わせごとに保持する静的部分の上限
+WHEEL_CACHE_SIZE = 128
+
+# 描画方式：'css'（conic-gradient＋ラベル div）/ 'svg'（扇形パス）/ 'auto'
+RENDERERS = ('css', 'svg', 'auto')
+# 'auto' でこの人数を超えたら SVG で描画する
+AUTO_SVG_THRESHOLD = 12
+
+# SVG の盤面ジオメトリ（viewBox 500×500）
+SVG_SIZE = 500
+SVG_CENTER = SVG_SIZE / 2
+SVG_RADIUS = 245
+SVG_LABEL_OUTER = 232
+SVG_LABEL_INNER = 58
+
+# ---- 静的テンプレート（プロセスにつき一度だけ組み立てる） ----
+
+# ルーレットのスタイル（単体HTMLとルーレットコンポーネントで共用）
+WHEEL_STYLE = """
+        body {
+            margin: 0;
+            padding: 0;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            min-height: 100vh;
+            background: transparent;
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+        }
+        .roulette-container {
+            position: relative;
+            width: 500px;
+            height: 500px;
+        }
+        .arrow {
+            position: absolute;
+            top: -25px;
+            left: 50%;
+            transform: translateX(-50%);
+            width: 0;
+            height: 0;
+            border-left: 25px solid transparent;
+            border-right: 25px solid transparent;
+            border-top: 50px solid #e74c3c;
+            filter: drop-shadow(0 8px 16px rgba(0,0,0,0.4));
+            z-index: 30;
+        }
+        #wheel {
+            position: relative;
+            width: 100%;
+            height: 100%;
+            border-radius: 50%;
+            border: 5px solid #2c3e50;
+            box-shadow: 0 25px 70px rgba(0,0,0,0.4);
+            overflow: visible;
+            transform: rotate(0deg);
+            transition: transform 0.1s ease;
+            z-index: 5;
+        }
+        .player-label, .special-label {
+            position: absolute;
+            top: 50%;
+            left: 50%;
+            transform: rotate(var(--angle)) translateY(-200px) rotate(calc(-1 * var(--angle)));
+            transform-origin: center center;
+            pointer-events: none;
+        }
+        .player-label span, .special-label span {
+            display: inline-block;
+            padding: 6px 14px;
+            color: white;
+            font-weight: bold;
+            font-size: 14px;
+            text-shadow: 2px 2px 8px rgba(0,0,0,0.9);
+            white-space: nowrap;
+            max-width: 120px;
+            overflow: hidden;
+            text-overflow: ellipsis;
+            text-align: center;
+            background: rgba(0,0,0,0.4);
+            border-radius: 15px;
+            backdrop-filter: blur(6px);
+            border: 2px solid rgba(255,255,255,0.3);
+        }
+        .special-label span {
+            background: rgba(255,215,0,0.3);
+            border: 2px solid rgba(255,215,0,0.6);
+            font-size: 12px;
+        }
+        .center-circle {
+            position: absolute;
+            top: 50%;
+            left: 50%;
+            transform: translate(-50%, -50%);
+            width: 90px;
+            height: 90px;
+            background: linear-gradient(135deg, #f39c12, #e67e22);
+            border: 5px solid white;
+            border-radius: 50%;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-size: 32px;
+            box-shadow: 0 8px 25px rgba(0,0,0,0.4);
+            z-index: 20;
+        }
+        .shield-icon {
+            font-style: normal;
+            display: none;
+        }
+        .shielded .shield-icon {
+            display: inline;
+        }
+        .highlight span {
+            background: rgba(231,76,60,0.85);
+            border-color: white;
+            box-shadow: 0 0 18px rgba(255,255,255,0.8);
+        }
+        .roulette-container.svg-mode {
+            width: min(500px, 96vw);
+            height: auto;
+            aspect-ratio: 1;
+            border-radius: 50%;
+            box-shadow: 0 25px 70px rgba(0,0,0,0.4);
+        }
+        svg#wheel {
+            display: block;
+            height: auto;
+            border: 0;
+            box-shadow: none;
+            will-change: transform;
+        }
+        svg#wheel text {
+            fill: white;
+            font-weight: bold;
+            paint-order: stroke;
+            stroke: rgba(0,0,0,0.55);
+            stroke-width: 3px;
+            dominant-baseline: central;
+        }
+        svg#wheel .special-label text {
+            fill: #fff6c2;
+        }
+        svg#wheel .highlight path {
+            stroke: white;
+            stroke-width: 4px;
+        }
+"""
+
+_DOCUMENT_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <style>""" + WHEEL_STYLE + """    </style>
+</head>
+<body>
+"""
+
+_SCRIPT_HEAD = """
+    <script>
+        (function() {
+            const wheel = document.getElementById('wheel');
+"""
+
+_SCRIPT_BODY = """            let reported = false;
+
+            // 回転完了を親フレーム（ルーレットコンポーネント）へ通知
+            function reportSpinComplete() {
+                if (reported || spinId === null) return;
+                reported = true;
+                window.parent.postMessage({ type: 'roulette:spinComplete', spinId: spinId }, '*');
+            }
+
+            if (spinning) {
+                wheel.style.transition = 'none';
+                wheel.style.transform = 'rotate(0deg)';
+                wheel.addEventListener('transitionend', (event) => {
+                    if (event.target === wheel) reportSpinComplete();
+                });
+                // transitionend が発火しない場合（タブ非表示など）の保険
+                setTimeout(reportSpinComplete, 4500);
+
+                requestAnimationFrame(() => {
+                    requestAnimationFrame(() => {
+                        wheel.style.transition = 'transform 4s cubic-bezier(0.25, 0.1, 0.25, 1)';
+                        wheel.style.transform = `rotate(${targetRotation}deg)`;
+                    });
+                });
+            } else {
+                wheel.style.transition = 'transform 0.6s ease-out';
+                wheel.style.transform = `rotate(${targetRotation}deg)`;
+            }
+        })();
+    </script>
+</body>
+</html>"""
+
+def _escape(text):
+    return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def resolve_renderer(renderer, num_players):
+    """'auto' を人数に応じて 'css' か 'svg' に決める"""
+    if renderer not in RENDERERS:
+        raise ValueError(f"未対応の描画方式です: {renderer}")
+    if renderer == 'auto':
+        return 'svg' if num_players > AUTO_SVG_THRESHOLD else 'css'
+    return renderer
+
+def _section_colors(num_players):
+    return [PLAYER_COLORS[i % len(PLAYER_COLORS)] for i in range(num_players)] + SPECIAL_COLORS
+
+@lru_cache(maxsize=WHEEL_CACHE_SIZE)
+def _css_wheel_markup(names, shielded_names):
+    """conic-gradient とラベル div による盤面"""
+    num_players = len(names)
+
+    # 特別セクションも含めた全セクション数
+    total_sections = num_players + len(SPECIAL_NAMES)
+    angle_per_section = 360 / total_sections
+
+    # グラデーション作成（プレイヤー → 特別セクションの順）
+    gradient = ", ".join(
+        f"{color} {i * angle_per_section}deg {(i + 1) * angle_per_section}deg"
+        for i, color in enumerate(_section_colors(num_players))
+    )
+
+    # ラベル生成（シールド表示は shielded クラスで切り替え）
+    labels = []
+    for i, name in enumerate(names):
+        label_angle = i * angle_per_section + angle_per_section / 2
+        shielded = " shielded" if name in shielded_names else ""
+        labels.append(f"""
+        <div class="player-label{shielded}" data-section="{i}" style="--angle: {label_angle}deg;">
+            <span><i class="shield-icon">🛡️</i>{_escape(name)}</span>
+        </div>
+        """)
+
+    for i, special_name in enumerate(SPECIAL_NAMES):
+        section = num_players + i
+        label_angle = section * angle_per_section + angle_per_section / 2
+        labels.append(f"""
+        <div class="special-label" data-section="{section}" style="--angle: {label_angle}deg;">
+            <span>{special_name}</span>
+        </div>
+        """)
+
+    labels_html = "".join(labels)
+    return f"""    <div class="roulette-container">
+        <div class="arrow"></div>
+        <div id="wheel" style="background: conic-gradient({gradient});">
+            {labels_html}
+        </div>
+        <div class="center-circle">🍶</div>
+    </div>
+"""
+
+def _svg_point(angle, radius):
+    """上を0度とした時計回りの角度 → SVG 座標"""
+    rad = math.radians(angle)
+    return SVG_CENTER + radius * math.sin(rad), SVG_CENTER - radius * math.cos(rad)
+
+@lru_cache(maxsize=WHEEL_CACHE_SIZE)
+def _svg_geometry(total_sections):
+    """セクション数ごとの扇形パス・ラベル位置・文字サイズ（事前計算）"""
+    angle_per_section = 360 / total_sections
+    large_arc = 1 if angle_per_section > 180 else 0
+
+    # ラベルは中心から外向きに配置し、扇形の幅に合わせて文字サイズを決める
+    arc_width = 2 * math.pi * (SVG_LABEL_OUTER * 0.75) * angle_per_section / 360
+    font_size = max(6.0, min(16.0, arc_width * 0.6))
+    max_chars = max(2, int((SVG_LABEL_OUTER - SVG_LABEL_INNER) / (font_size * 0.95)))
+
+    sections = []
+    for i in range(total_sections):
+        start = i * angle_per_section
+        x0, y0 = _svg_point(start, SVG_RADIUS)
+        x1, y1 = _svg_point(start + angle_per_section, SVG_RADIUS)
+        path = (f"M{SVG_CENTER:g},{SVG_CENTER:g} L{x0:.2f},{y0:.2f} "
+                f"A{SVG_RADIUS},{SVG_RADIUS} 0 {large_arc} 1 {x1:.2f},{y1:.2f} Z")
+        label_rotation = start + angle_per_section / 2 - 90
+        sections.append((path, label_rotation))
+    return tuple(sections), font_size, max_chars
+
+def _truncate(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+@lru_cache(maxsize=WHEEL_CACHE_SIZE)
+def _svg_wheel_markup(names, shielded_names):
+    """扇形パスと放射状ラベルによる盤面（大人数向け）"""
+    num_players = len(names)
+    colors = _section_colors(num_players)
+    sections, font_size, max_chars = _svg_geometry(num_players + len(SPECIAL_NAMES))
+    label_x = SVG_CENTER + SVG_LABEL_OUTER
+
+    groups = []
+    for i, (path, label_rotation) in enumerate(sections):
+        if i < num_players:
+            name = names[i]
+            css_class = "player-label shielded" if name in shielded_names else "player-label"
+            text = (f'<tspan class="shield-icon">🛡️</tspan>'
+                    f'{_escape(_truncate(name, max_chars))}')
+        else:
+            css_class = "special-label"
+            text = _escape(SPECIAL_NAMES[i - num_players])
+        groups.append(
+            f'<g class="{css_class}" data-section="{i}">'
+            f'<path d="{path}" fill="{colors[i]}"/>'
+            f'<text x="{label_x:g}" y="{SVG_CENTER:g}" text-anchor="end" font-size="{font_size:.1f}" '
+            f'transform="rotate({label_rotation:.3f} {SVG_CENTER:g} {SVG_CENTER:g})">{text}</text>'
+            f'</g>'
+        )
+
+    groups_svg = "\n            ".join(groups)
+    return f"""    <div class="roulette-container svg-mode">
+        <div class="arrow"></div>
+        <svg id="wheel" viewBox="0 0 {SVG_SIZE} {SVG_SIZE}" xmlns="http://www.w3.org/2000/svg">
+            {groups_svg}
+            <circle cx="{SVG_CENTER:g}" cy="{SVG_CENTER:g}" r="{SVG_RADIUS}" fill="none" stroke="#2c3e50" stroke-width="5"/>
+        </svg>
+        <div class="center-circle">🍶</div>
+    </div>
+"""
+
+def _wheel_markup(names, shielded_names, renderer='css'):
+    """盤面が同じ間は変わらないマークアップ"""
+    if resolve_renderer(renderer, len(names)) == 'svg':
+        return _svg_wheel_markup(names, shielded_names)
+    return _css_wheel_markup(names, shielded_names)
+
+@lru_cache(maxsize=WHEEL_CACHE_SIZE)
+def _wheel_document_prefix(names, shielded_names, renderer='css'):
+    """単体HTMLのうち回転角度より前の部分"""
+    return _DOCUMENT_HEAD + _wheel_markup(names, shielded_names, renderer) + _SCRIPT_HEAD
+
+@lru_cache(maxsize=WHEEL_CACHE_SIZE)
+def wheel_layout(names, renderer='auto'):
+    """ルーレットコンポーネントに一度だけ送る盤面（シールドは別途差分で送る）"""
+    renderer = resolve_renderer(renderer, len(names))
+    markup = _wheel_markup(names, frozenset(), renderer)
+    digest = hashlib.sha1("\x1f".join(names).encode("utf-8")).hexdigest()[:16]
+    return {'key': f"{renderer}-{digest}", 'style': WHEEL_STYLE, 'markup': markup}
+
+def section_index(num_players, selected_index=None, selected_special=None):
+    """選ばれたセクションの番号（未選択なら None）"""
+    if selected_index is not None:
+        return selected_index
+    if selected_special is not None:
+        return num_players + SPECIAL_INDEX.get(selected_special, 0)
+    return None
+
+def calculate_target_rotation(num_players, selected_index=None, selected_special=None, spinning=False):
+    """矢印の位置に止めるための回転角度"""
+    angle_per_section = 360 / (num_players + len(SPECIAL_NAMES))
+    section = section_index(num_players, selected_index, selected_special)
+    if section is None:
+        return 0
+
+    target_angle = -(section * angle_per_section + angle_per_section / 2)
+    if spinning:
+        return target_angle + random.randint(1440, 2160)  # 4-6回転
+    return target_angle
+
+def create_enhanced_roulette_html(players, selected_index=None, selected_special=None, spinning=False, spin_id=None,
+                                  shielded_names=frozenset(), renderer='css'):
+    """進化したルーレットHTML生成（盤面部分はキャッシュし、回転角度だけ毎回計算）
+
+    renderer='svg'（または大人数時の 'auto'）で扇形パスによる描画に切り替える。
+    """
+    names = tuple(str(p['name']) for p in players)
+    prefix = _wheel_document_prefix(names, frozenset(shielded_names), renderer)
+    total_rotation = calculate_target_rotation(len(names), selected_index, selected_special, spinning)
+
+    script_vars = (f"            const spinning = {str(spinning).lower()};\n"
+                   f"            const targetRotation = {total_rotation};\n"
+                   f"            const spinId = {json.dumps(spin_id)};\n")
+    return prefix + script_vars + _SCRIPT_BODY
+
+def render_cache_info():
+    """盤面キャッシュのヒット・ミス数"""
+    return {'css': _css_wheel_markup.cache_info(), 'svg': _svg_wheel_markup.cache_info()}
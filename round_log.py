@@ -0,0 +1,79 @@
+from dataclasses import astuple, dataclass
+from typing import Optional
+
+# 何ラウンドごとに状態のスナップショットを取るか
+SNAPSHOT_INTERVAL = 8
+
+@dataclass(frozen=True)
+class RoundEvent:
+    """1回の回転の記録（これだけで状態を再現できる）"""
+    round_number: int
+    seed: int
+    selected_index: Optional[int] = None
+    special: Optional[str] = None
+    target_index: Optional[int] = None
+    multiplier: Optional[float] = None
+    shield_consumed: bool = False
+
+    def to_tuple(self):
+        """保存用のコンパクトな形"""
+        return astuple(self)
+
+    @classmethod
+    def from_tuple(cls, values):
+        return cls(*values)
+
+@dataclass(frozen=True)
+class EngineSnapshot:
+    """あるラウンド終了時点のゲーム状態"""
+    round_count: int
+    progress: tuple
+    shields: frozenset
+
+class RoundLog:
+    """追記のみのラウンド記録と、一定間隔のスナップショット
+
+    任意のラウンドへ戻すときは直前のスナップショットから高々 snapshot_interval 件を
+    再生するだけで済むので、取り消し・再生はゲームが長くても償却 O(1)。
+    """
+    def __init__(self, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.events = []
+        self._snapshots = {}
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def append(self, event):
+        if event.round_number != len(self.events) + 1:
+            raise ValueError(f"ラウンド {len(self.events) + 1} の記録が必要です: {event.round_number}")
+        self.events.append(event)
+
+    def wants_snapshot(self, round_count):
+        return round_count % self.snapshot_interval == 0 and round_count not in self._snapshots
+
+    def add_snapshot(self, snapshot):
+        self._snapshots[snapshot.round_count] = snapshot
+
+    def nearest_snapshot(self, round_count):
+        """round_count 以前で最も新しいスナップショット（無ければ None＝開始時点）"""
+        base = round_count - round_count % self.snapshot_interval
+        while base > 0:
+            snapshot = self._snapshots.get(base)
+            if snapshot is not None:
+                return snapshot
+            base -= self.snapshot_interval
+        return None
+
+    def truncate(self, round_count):
+        """round_count より後の記録とスナップショットを捨てる"""
+        del self.events[round_count:]
+        for key in [key for key in self._snapshots if key > round_count]:
+            del self._snapshots[key]
+
+    def clear(self):
+        self.events.clear()
+        self._snapshots.clear()
@@ -0,0 +1,179 @@
+import argparse
+import json
+
+import numpy as np
+
+from game_engine import DEFAULT_WEIGHT_PARAMS, DIFFICULTY_ROUNDS, SPECIAL_TYPES, calculate_drink_amount
+
+# 特別セクションの番号（SPECIAL_TYPES の並び順）
+SHIELD, DOUBLE, EVERYONE = (SPECIAL_TYPES.index(t) for t in ('shield', 'double', 'everyone'))
+
+# calculate_drink_amount の (強さ, 好み) → 倍率 の早見表（添字 1〜5 を使用）
+DRINK_TABLE = np.zeros((6, 6))
+for _s in range(1, 6):
+    for _p in range(1, 6):
+        DRINK_TABLE[_s, _p] = calculate_drink_amount({'strength': _s, 'preference': _p})
+
+def random_rosters(rng, num_games, num_players):
+    """強さ・好み（1〜5）をランダムに割り当てた参加者を試合数ぶん作成"""
+    strength = rng.integers(1, 6, size=(num_games, num_players))
+    preference = rng.integers(1, 6, size=(num_games, num_players))
+    return strength, preference
+
+def fixed_roster(players, num_games):
+    """同じ参加者（プレイヤー dict のリスト）で試合数ぶん作成"""
+    strength = np.array([p['strength'] for p in players], dtype=np.int64)
+    preference = np.array([p['preference'] for p in players], dtype=np.int64)
+    shape = (num_games, len(players))
+    return np.broadcast_to(strength, shape), np.broadcast_to(preference, shape)
+
+def calculate_player_weights(drunk_degree, strength, preference, params=DEFAULT_WEIGHT_PARAMS):
+    """calculate_player_weight のベクトル版"""
+    base = params['base'] + (1.0 - drunk_degree / 100.0) * params['slope']
+    adj = 1.0 + (5 - strength) * params['strength_step'] + (preference - 3) * params['preference_step']
+    return np.maximum(0.1, base * adj)
+
+def update_drunk_degrees(drunk_degree, total_drunk, multiplier):
+    """update_drunk_degree のベクトル版（multiplier は drunk_degree と同形）"""
+    np.minimum(drunk_degree + multiplier * 10, 100, out=drunk_degree)
+    total_drunk += multiplier
+
+def calculate_balance_scores(drunk_degree):
+    """試合ごとのバランススコア（analyze_game_balance と同じ定義）"""
+    spread = drunk_degree.max(axis=1) - drunk_degree.min(axis=1)
+    return np.maximum(0, 100 - spread)
+
+def simulate_games(strength, preference, max_rounds, rng, params=DEFAULT_WEIGHT_PARAMS):
+    """全試合を同時に max_rounds ラウンド進め、最終的な酔い度と総飲酒量を返す"""
+    num_games, num_players = strength.shape
+    games = np.arange(num_games)
+    drunk_degree = np.zeros((num_games, num_players))
+    total_drunk = np.zeros((num_games, num_players))
+    shields = np.zeros((num_games, num_players), dtype=bool)
+    base_amount = DRINK_TABLE[strength, preference]
+
+    for _ in range(max_rounds):
+        multiplier = np.zeros((num_games, num_players))
+
+        # 特別セクション判定（既定15%の確率）
+        is_special = rng.random(num_games) < params['special_probability']
+        special_type = rng.integers(0, len(SPECIAL_TYPES), size=num_games)
+        special_target = rng.integers(0, num_players, size=num_games)
+
+        # 通常のプレイヤー選択（重み付きランダム）
+        weights = calculate_player_weights(drunk_degree, strength, preference, params)
+        cumulative = np.cumsum(weights, axis=1)
+        threshold = rng.random(num_games) * cumulative[:, -1]
+        selected = np.minimum((cumulative <= threshold[:, None]).sum(axis=1), num_players - 1)
+
+        # シールド：選ばれた人がシールド持ちなら消費して無効
+        normal = ~is_special
+        blocked = normal & shields[games, selected]
+        shields[games[blocked], selected[blocked]] = False
+        drink = normal & ~blocked
+        multiplier[games[drink], selected[drink]] = base_amount[games[drink], selected[drink]]
+
+        # 特別効果
+        grant = is_special & (special_type == SHIELD)
+        shields[games[grant], special_target[grant]] = True
+
+        double = is_special & (special_type == DOUBLE)
+        multiplier[games[double], special_target[double]] = base_amount[games[double], special_target[double]] * 2.0
+
+        everyone = is_special & (special_type == EVERYONE)
+        multiplier[everyone] = 0.5
+
+        update_drunk_degrees(drunk_degree, total_drunk, multiplier)
+
+    return drunk_degree, total_drunk
+
+def summarize(values):
+    """分布の要約統計"""
+    percentiles = np.percentile(values, [5, 25, 50, 75, 95])
+    return {
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'p5': float(percentiles[0]),
+        'p25': float(percentiles[1]),
+        'p50': float(percentiles[2]),
+        'p75': float(percentiles[3]),
+        'p95': float(percentiles[4]),
+    }
+
+def evaluate_difficulty(max_rounds, num_games, num_players, seed=None, roster=None, batch_size=200_000,
+                        params=DEFAULT_WEIGHT_PARAMS):
+    """1つの難易度を num_games 試合ぶんシミュレーションして分布を返す"""
+    rng = np.random.default_rng(seed)
+    drunk_chunks = []
+    score_chunks = []
+
+    for start in range(0, num_games, batch_size):
+        size = min(batch_size, num_games - start)
+        if roster is not None:
+            strength, preference = fixed_roster(roster, size)
+        else:
+            strength, preference = random_rosters(rng, size, num_players)
+        drunk_degree, _ = simulate_games(strength, preference, max_rounds, rng, params)
+        drunk_chunks.append(drunk_degree.ravel())
+        score_chunks.append(calculate_balance_scores(drunk_degree))
+
+    drunk_degree = np.concatenate(drunk_chunks)
+    balance_score = np.concatenate(score_chunks)
+    return {
+        'rounds': max_rounds,
+        'games': num_games,
+        'final_drunk_degree': summarize(drunk_degree),
+        'balance_score': summarize(balance_score),
+        # analyze_game_balance の評価区分ごとの割合
+        'balance_grades': {
+            'excellent': float((balance_score >= 80).mean()),
+            'good': float(((balance_score >= 60) & (balance_score < 80)).mean()),
+            'uneven': float(((balance_score >= 40) & (balance_score < 60)).mean()),
+            'poor': float((balance_score < 40).mean()),
+        },
+    }
+
+def format_report(results):
+    """結果を表形式の文字列にする"""
+    lines = []
+    for name, result in results.items():
+        drunk = result['final_drunk_degree']
+        score = result['balance_score']
+        grades = result['balance_grades']
+        lines.append(f"[{name}] {result['rounds']}ラウンド × {result['games']:,}試合")
+        lines.append(f"  最終酔い度   平均 {drunk['mean']:5.1f}%  標準偏差 {drunk['std']:5.1f}  "
+                     f"p5/p50/p95 {drunk['p5']:.1f}/{drunk['p50']:.1f}/{drunk['p95']:.1f}")
+        lines.append(f"  バランススコア 平均 {score['mean']:5.1f}   標準偏差 {score['std']:5.1f}  "
+                     f"p5/p50/p95 {score['p5']:.1f}/{score['p50']:.1f}/{score['p95']:.1f}")
+        lines.append(f"  評価区分      80以上 {grades['excellent']:.1%}  60〜80 {grades['good']:.1%}  "
+                     f"40〜60 {grades['uneven']:.1%}  40未満 {grades['poor']:.1%}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="公平性評価用モンテカルロシミュレーター")
+    parser.add_argument("--games", type=int, default=1_000_000, help="難易度ごとの試合数")
+    parser.add_argument("--players", type=int, default=5, help="参加人数（--roster 未指定時）")
+    parser.add_argument("--roster", help="参加者リストの JSON ファイル（strength / preference を含む dict の配列）")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=200_000)
+    parser.add_argument("--json", action="store_true", help="JSON で出力")
+    args = parser.parse_args()
+
+    roster = None
+    if args.roster:
+        with open(args.roster, encoding="utf-8") as f:
+            roster = json.load(f)
+
+    results = {}
+    for i, (name, rounds) in enumerate(DIFFICULTY_ROUNDS.items()):
+        seed = None if args.seed is None else args.seed + i
+        results[name] = evaluate_difficulty(rounds, args.games, args.players, seed=seed,
+                                            roster=roster, batch_size=args.batch_size)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import time
+
+from ai_events import AIEventDispatcher, AIEventStream, CircuitBreaker, FakeBackend, RuleBasedBackend
+
+PLAYERS = [{'name': "プレイヤー1", 'drunk_degree': 20.0, 'total_drunk': 1.0},
+           {'name': "プレイヤー2", 'drunk_degree': 40.0, 'total_drunk': 2.0}]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_dispatcher(clock):
+    backend = FakeBackend(text="「今回は免除」テスト", error=RuntimeError("down"))
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=1.0, reset_seconds=30.0, clock=clock)
+    dispatcher = AIEventDispatcher(backend, max_workers=1, fallback=RuleBasedBackend(), breaker=breaker)
+    return dispatcher, backend, breaker
+
+def generate(dispatcher, stream=None):
+    return dispatcher.submit(PLAYERS[0], PLAYERS, stream=stream).result(timeout=5)
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = FakeClock()
+    dispatcher, backend, breaker = make_dispatcher(clock)
+    try:
+        generate(dispatcher)
+        assert breaker.state == 'closed'
+        generate(dispatcher)
+        assert breaker.state == 'open'
+        assert dispatcher.active_backend is dispatcher.fallback
+    finally:
+        dispatcher.shutdown()
+
+def test_open_breaker_answers_locally_and_finishes_stream():
+    clock = FakeClock()
+    dispatcher, backend, breaker = make_dispatcher(clock)
+    try:
+        generate(dispatcher)
+        generate(dispatcher)
+        stream = AIEventStream()
+        text = generate(dispatcher, stream)
+        assert text and stream.text == text
+        assert stream.done and stream.source == 'local'
+    finally:
+        dispatcher.shutdown()
+
+def test_half_open_success_closes_breaker():
+    clock = FakeClock()
+    dispatcher, backend, breaker = make_dispatcher(clock)
+    try:
+        generate(dispatcher)
+        generate(dispatcher)
+        clock.now += 30.0
+        assert breaker.state == 'half_open'
+        backend.error = None
+        assert generate(dispatcher) == backend.text
+        assert breaker.state == 'closed'
+    finally:
+        dispatcher.shutdown()
+
+def test_half_open_failure_reopens_breaker():
+    clock = FakeClock()
+    dispatcher, backend, breaker = make_dispatcher(clock)
+    try:
+        generate(dispatcher)
+        generate(dispatcher)
+        clock.now += 30.0
+        assert breaker.state == 'half_open'
+        generate(dispatcher)
+        assert breaker.state == 'open'
+        # 開き直した時刻から数え直す
+        clock.now += 29.0
+        assert breaker.state == 'open'
+    finally:
+        dispatcher.shutdown()
+
+def test_half_open_allows_a_single_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30.0, clock=clock)
+    breaker.record(0.0, ok=False)
+    clock.now += 30.0
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+class CountingBackend(FakeBackend):
+    """個別の生成を呼ばれた回数を数える（先読みでは本人以外の提案だけを返す）"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+
+    def generate(self, selected_player, all_players):
+        self.calls += 1
+        return super().generate(selected_player, all_players)
+
+    def generate_batch(self, players, cases):
+        time.sleep(self.delay)
+        return {}
+
+def test_prefetch_chain_generates_when_batch_misses():
+    backend = CountingBackend(delay=0.05)
+    dispatcher = AIEventDispatcher(backend, max_workers=1)
+    try:
+        prefetched = dispatcher.prefetch(PLAYERS, [(PLAYERS[1], PLAYERS)])
+        future = dispatcher.submit(PLAYERS[0], PLAYERS, deadline=time.time() + 5, prefetched=prefetched)
+        assert future.result(timeout=5) == backend.text
+        assert backend.calls == 1
+    finally:
+        dispatcher.shutdown()
+
+def test_cancelled_prefetch_chain_does_not_call_backend(caplog):
+    backend = CountingBackend(delay=0.2)
+    dispatcher = AIEventDispatcher(backend, max_workers=1)
+    try:
+        prefetched = dispatcher.prefetch(PLAYERS, [(PLAYERS[1], PLAYERS)])
+        future = dispatcher.submit(PLAYERS[0], PLAYERS, deadline=time.time() + 5, prefetched=prefetched)
+        assert future.cancel()
+        prefetched.result(timeout=5)
+        # ワーカーは1つなので、この生成が終わる頃には先読みの後始末も済んでいる
+        assert dispatcher.submit(PLAYERS[0], PLAYERS).result(timeout=5) == backend.text
+        assert backend.calls == 1
+        assert not [record for record in caplog.records if record.name == 'concurrent.futures']
+    finally:
+        dispatcher.shutdown()
+
+def test_result_within_deadline_is_delivered():
+    backend = FakeBackend(delay=0.05)
+    dispatcher = AIEventDispatcher(backend)
+    try:
+        future = dispatcher.submit(PLAYERS[0], PLAYERS, deadline=time.time() + 2.0)
+        assert future.result(timeout=5) == backend.text
+    finally:
+        dispatcher.shutdown()
+
+def test_result_after_deadline_is_dropped():
+    backend = FakeBackend(delay=0.3)
+    dispatcher = AIEventDispatcher(backend)
+    try:
+        started = time.time()
+        future = dispatcher.submit(PLAYERS[0], PLAYERS, deadline=started + 0.05)
+        # 呼び出し側は待たされない（生成はワーカーで進む）
+        assert not future.done()
+        assert future.result(timeout=5) is None
+        assert time.time() - started >= 0.3
+    finally:
+        dispatcher.shutdown()
+
+def test_stream_delivers_partial_text_before_completion():
+    backend = FakeBackend(delay=0.05, chunk_size=4, chunk_delay=0.05)
+    dispatcher = AIEventDispatcher(backend)
+    try:
+        stream = AIEventStream()
+        future = dispatcher.submit(PLAYERS[0], PLAYERS, deadline=time.time() + 5, stream=stream)
+        partial = ""
+        while not partial and not future.done():
+            partial = stream.text
+            time.sleep(0.005)
+        assert partial and len(partial) < len(backend.text) and backend.text.startswith(partial)
+        assert stream.first_token_seconds is not None and stream.first_token_seconds >= 0.05
+
+        assert future.result(timeout=5) == backend.text
+        assert stream.text == backend.text
+        assert stream.done and stream.source == 'fake'
+        assert stream.total_seconds >= stream.first_token_seconds
+    finally:
+        dispatcher.shutdown()
@@ -0,0 +1,53 @@
+from dataclasses import replace
+
+from game_engine import GameEngine
+
+def make_players():
+    return [{'name': f"プレイヤー{i + 1}", 'strength': strength, 'preference': preference, 'cup_type': 'おちょこ',
+             'total_drunk': 0, 'drunk_degree': 0}
+            for i, (strength, preference) in enumerate([(1, 5), (3, 3), (5, 1), (2, 4), (4, 2)])]
+
+def play(seed, rounds=15):
+    engine = GameEngine(make_players(), max_rounds=rounds, seed=seed)
+    engine.auto_play()
+    return engine
+
+def test_same_seed_gives_same_game():
+    first, second = play(seed=42), play(seed=42)
+    assert first.log.events == second.log.events
+    assert [(p['drunk_degree'], p['total_drunk']) for p in first.players] == \
+        [(p['drunk_degree'], p['total_drunk']) for p in second.players]
+
+def test_verify_log_accepts_recorded_game():
+    engine = play(seed=7)
+    assert engine.round_count == engine.max_rounds
+    assert engine.verify_log() is None
+
+def test_verify_log_rejects_replaced_seed():
+    engine = play(seed=7)
+    event = engine.log.events[4]
+    engine.log.events[4] = replace(event, seed=event.seed + 1)
+    assert engine.verify_log() == event.round_number
+
+def test_verify_log_rejects_forged_round_with_other_seed():
+    # 最終ラウンドを、別の人が選ばれるシードで決め直した記録に差し替える
+    engine = play(seed=7)
+    last = engine.log.events[-1]
+    before = GameEngine.replay(make_players(), engine.log.events[:-1], max_rounds=engine.max_rounds,
+                               seed=engine.seed)
+    forged = next(event for event in (before.decide(last.round_number, seed) for seed in range(1000))
+                  if event.selected_index != last.selected_index)
+    engine.log.events[-1] = forged
+    assert engine.verify_log() == last.round_number
+
+def test_verify_log_rejects_changed_selection():
+    engine = play(seed=7)
+    position, event = next((i, e) for i, e in enumerate(engine.log.events) if e.selected_index is not None)
+    other = (event.selected_index + 1) % len(engine.players)
+    engine.log.events[position] = replace(event, selected_index=other)
+    assert engine.verify_log() == event.round_number
+
+def test_replay_restores_state():
+    engine = play(seed=3)
+    replayed = GameEngine.replay(make_players(), engine.log.events, max_rounds=engine.max_rounds, seed=engine.seed)
+    assert [p['drunk_degree'] for p in replayed.players] == [p['drunk_degree'] for p in engine.players]
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from game_engine import DEFAULT_WEIGHT_PARAMS, DIFFICULTY_ROUNDS, WEIGHT_PROFILES_PATH
+from simulator import calculate_balance_scores, fixed_roster, random_rosters, simulate_games
+
+# 探索範囲（ゲーム性を損なわないよう特別セクションは一定割合残す）
+PARAM_BOUNDS = {
+    'base': (0.1, 1.0),
+    'slope': (0.0, 3.0),
+    'strength_step': (-0.1, 0.2),
+    'preference_step': (-0.1, 0.2),
+    'special_probability': (0.05, 0.25),
+}
+
+def load_rosters(path):
+    """参加者分布の JSON を読み込む（参加者リスト、またはそのリスト）"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data and isinstance(data[0], dict):
+        data = [data]
+    return data
+
+def evaluate_candidate(params, max_rounds, rosters, num_players, games, seed):
+    """候補パラメータの期待バランススコアを求める（プロセスプール上で実行）"""
+    started = time.process_time()
+    # 全候補で同じ乱数列を使い、比較のばらつきを抑える
+    rng = np.random.default_rng(seed)
+
+    if rosters:
+        per_roster = max(1, games // len(rosters))
+        scores = []
+        for roster in rosters:
+            strength, preference = fixed_roster(roster, per_roster)
+            drunk_degree, _ = simulate_games(strength, preference, max_rounds, rng, params)
+            scores.append(calculate_balance_scores(drunk_degree).mean())
+        score = float(np.mean(scores))
+    else:
+        strength, preference = random_rosters(rng, games, num_players)
+        drunk_degree, _ = simulate_games(strength, preference, max_rounds, rng, params)
+        score = float(calculate_balance_scores(drunk_degree).mean())
+
+    return params, score, time.process_time() - started
+
+def random_candidate(rng):
+    """探索範囲から一様にサンプリング"""
+    return {name: float(rng.uniform(low, high)) for name, (low, high) in PARAM_BOUNDS.items()}
+
+def perturb_candidate(params, rng, scale):
+    """現在の最良値の近傍をサンプリング"""
+    candidate = {}
+    for name, (low, high) in PARAM_BOUNDS.items():
+        value = params[name] + rng.normal(0, (high - low) * scale)
+        candidate[name] = float(np.clip(value, low, high))
+    return candidate
+
+def tune_difficulty(pool, workers, max_rounds, rosters, num_players, games, cpu_budget, seed):
+    """CPU時間の予算内でランダム探索＋近傍探索を行い、最良パラメータを返す"""
+    rng = np.random.default_rng(seed)
+    best_params = dict(DEFAULT_WEIGHT_PARAMS)
+    _, baseline_score, cpu_used = evaluate_candidate(best_params, max_rounds, rosters, num_players, games, seed)
+    best_score = baseline_score
+    evaluations = 1
+    scale = 0.15
+
+    while cpu_used < cpu_budget:
+        candidates = []
+        for i in range(workers):
+            if i % 2 == 0:
+                candidates.append(perturb_candidate(best_params, rng, scale))
+            else:
+                candidates.append(random_candidate(rng))
+
+        futures = [pool.submit(evaluate_candidate, c, max_rounds, rosters, num_players, games, seed)
+                   for c in candidates]
+        improved = False
+        for future in as_completed(futures):
+            params, score, cpu_seconds = future.result()
+            cpu_used += cpu_seconds
+            evaluations += 1
+            if score > best_score:
+                best_params, best_score, improved = params, score, True
+
+        # 改善がなければ近傍を絞り込む
+        if not improved:
+            scale = max(0.01, scale * 0.7)
+
+    # 探索に使っていない乱数列で検証
+    validation_seed = seed + 1_000_003
+    _, validation_score, _ = evaluate_candidate(best_params, max_rounds, rosters, num_players, games, validation_seed)
+    _, validation_baseline, _ = evaluate_candidate(dict(DEFAULT_WEIGHT_PARAMS), max_rounds, rosters,
+                                                    num_players, games, validation_seed)
+    # 検証で既定値より悪ければ、探索に過剰適合しただけなので既定値のままにする
+    fell_back = validation_score < validation_baseline
+    if fell_back:
+        best_params, validation_score = dict(DEFAULT_WEIGHT_PARAMS), validation_baseline
+
+    return {
+        'rounds': max_rounds,
+        'params': best_params,
+        'score': validation_score,
+        'baseline_score': validation_baseline,
+        'fell_back': fell_back,
+        'evaluations': evaluations,
+        'cpu_seconds': cpu_used,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="公平ウェイトの自動チューニング")
+    parser.add_argument("--rosters", help="参加者分布の JSON ファイル（未指定ならランダムな参加者）")
+    parser.add_argument("--players", type=int, default=5, help="参加人数（--rosters 未指定時）")
+    parser.add_argument("--games", type=int, default=20_000, help="候補1つあたりの試合数")
+    parser.add_argument("--cpu-budget", type=float, default=120.0, help="難易度全体で使うCPU時間（秒）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=WEIGHT_PROFILES_PATH)
+    args = parser.parse_args()
+
+    rosters = load_rosters(args.rosters) if args.rosters else None
+    budget_per_difficulty = args.cpu_budget / len(DIFFICULTY_ROUNDS)
+
+    profiles = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for i, (name, rounds) in enumerate(DIFFICULTY_ROUNDS.items()):
+            profile = tune_difficulty(pool, args.workers, rounds, rosters, args.players, args.games,
+                                      budget_per_difficulty, args.seed + i)
+            profiles[name] = profile
+            print(f"[{name}] バランススコア {profile['baseline_score']:.2f} → {profile['score']:.2f} "
+                  f"（{profile['evaluations']}候補, CPU {profile['cpu_seconds']:.1f}秒）")
+            if profile['fell_back']:
+                print(f"[{name}] 検証で既定値を上回らなかったため、既定値を保存します")
+
+    output = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'objective': 'mean_balance_score',
+        'profiles': profiles,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"保存しました: {args.output}")
+
+if __name__ == "__main__":
+    main()
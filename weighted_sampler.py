@@ -0,0 +1,65 @@
+import random
+
+class FenwickSampler:
+    """Fenwick木（BIT）による重み付きサンプラー
+
+    1人分の重み更新と抽選が O(log n)、全員の一括更新が O(n)。
+    """
+    def __init__(self, weights=()):
+        self.rebuild(weights)
+
+    def __len__(self):
+        return len(self._weights)
+
+    @property
+    def total(self):
+        return self._total
+
+    def weight(self, index):
+        return self._weights[index]
+
+    def rebuild(self, weights):
+        """全員の重みを一括で設定（O(n)）"""
+        self._weights = [float(w) for w in weights]
+        n = len(self._weights)
+        tree = [0.0] * (n + 1)
+        for i, w in enumerate(self._weights, 1):
+            tree[i] += w
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._total = sum(self._weights)
+        self._top_bit = 1 << (n.bit_length() - 1) if n else 0
+
+    def update(self, index, weight):
+        """1人分の重みを更新（O(log n)）"""
+        weight = float(weight)
+        delta = weight - self._weights[index]
+        if delta == 0:
+            return
+        self._weights[index] = weight
+        self._total += delta
+        n = len(self._weights)
+        i = index + 1
+        while i <= n:
+            self._tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """累積重みが value を超える最初の位置（O(log n)）"""
+        n = len(self._weights)
+        pos = 0
+        bit = self._top_bit
+        while bit:
+            nxt = pos + bit
+            if nxt <= n and self._tree[nxt] <= value:
+                pos = nxt
+                value -= self._tree[nxt]
+            bit >>= 1
+        # 浮動小数点の誤差で末尾を越えないように
+        return min(pos, n - 1)
+
+    def sample(self, rng=random):
+        """重みに比例した確率で位置を1つ選ぶ"""
+        return self.find(rng.random() * self._total)